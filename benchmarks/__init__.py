@@ -0,0 +1 @@
+"""Benchmarks of ISV over a synthetic Genovisio database, see `python -m benchmarks.run --help`."""
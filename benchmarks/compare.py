@@ -0,0 +1,64 @@
+"""Compare two benchmark results, failing if any median latency regressed by more than the threshold."""
+
+import argparse
+import json
+import sys
+from typing import Any
+
+# rows of each section are matched by this key
+SECTION_KEYS = {"annotate": "size", "predict": "batch_size", "run": "batch_size", "serialization": "case"}
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], metric: str) -> list[dict[str, Any]]:
+    """Ratio current / baseline of the metric for every row present in both results."""
+    comparisons = []
+    for section, key in SECTION_KEYS.items():
+        baseline_rows = {row[key]: row for row in baseline.get(section, [])}
+        for row in current.get(section, []):
+            baseline_row = baseline_rows.get(row[key])
+            if baseline_row is None:
+                continue
+            comparisons.append(
+                {
+                    "section": section,
+                    key: row[key],
+                    "baseline": baseline_row[metric],
+                    "current": row[metric],
+                    "ratio": row[metric] / baseline_row[metric],
+                }
+            )
+    return comparisons
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare benchmark results of python -m benchmarks.run.")
+    parser.add_argument("baseline", help="Results JSON of the reference version")
+    parser.add_argument("current", help="Results JSON of the version under test")
+    parser.add_argument("--metric", help="Latency metric to compare", default="p50_seconds")
+    parser.add_argument(
+        "--threshold", help="Allowed relative slowdown, e.g. 0.2 for 20%%, before failing", type=float, default=0.2
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = 0
+    for comparison in compare(baseline, current, args.metric):
+        key = SECTION_KEYS[comparison["section"]]
+        regressed = comparison["ratio"] > 1 + args.threshold
+        regressions += regressed
+        row = f"{comparison['section']} {key}={comparison[key]}"
+        print(
+            f"{row:<30} {comparison['baseline']:.6f} s -> {comparison['current']:.6f} s "
+            f"({comparison['ratio']:.2f}x){' REGRESSED' if regressed else ''}"
+        )
+    if regressions:
+        print(f"{regressions} benchmarks regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Latency and throughput of annotate, predict and isv-run over a synthetic database, stored as JSON.
+
+Run from the repository root, e.g. `python -m benchmarks.run --output results.json`, and compare two results using
+`python -m benchmarks.compare baseline.json results.json`.
+"""
+
+import argparse
+import contextlib
+import datetime
+import enum
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, ContextManager, Iterator, TextIO
+from unittest import mock
+
+import numpy as np
+
+from benchmarks import synthetic_db
+from isv import main as isv_main
+from isv.annotate import CNVAnnotation, annotate
+from isv.predict import ShapMode, add_shap_argument, predict_many
+from isv.src import cli_args, genovisio_sources_db, snapshot
+from isv.src.cnv_region import CNVRegion, CNVType
+from isv.src.instrumentation import METRICS
+from isv.src.model_registry import MODEL_REGISTRY
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000, 50_000_000]
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1000]
+DEFAULT_RUN_BATCH_SIZES = [10, 100]
+
+
+class Backend(enum.StrEnum):
+    EXPORT = "export"
+    SNAPSHOT = "snapshot"
+    MONGOMOCK = "mongomock"
+    MONGODB = "mongodb"
+
+
+def summarize(latencies: list[float], items_per_call: int = 1) -> dict[str, float]:
+    """Latency statistics (in seconds) of the calls and their throughput (items per second)."""
+    quantiles = statistics.quantiles(latencies, n=20, method="inclusive") if len(latencies) > 1 else latencies * 19
+    return {
+        "calls": len(latencies),
+        "mean_seconds": statistics.fmean(latencies),
+        "p50_seconds": statistics.median(latencies),
+        "p95_seconds": quantiles[18],
+        "max_seconds": max(latencies),
+        "throughput_per_second": items_per_call * len(latencies) / sum(latencies),
+    }
+
+
+def random_regions(
+    rng: np.random.Generator, chromosomes: list[str], chromosome_length: int, size: int, count: int
+) -> list[CNVRegion]:
+    regions = []
+    for _ in range(count):
+        start = int(rng.integers(1, max(chromosome_length - size, 2)))
+        chromosome = str(rng.choice(chromosomes))
+        cnv_type = CNVType.LOSS if rng.random() < 0.5 else CNVType.GAIN
+        regions.append(CNVRegion(chromosome, start, start + size - 1, cnv_type))
+    return regions
+
+
+@contextlib.contextmanager
+def prepare_backend(
+    backend: Backend, documents: synthetic_db.Documents, work_dir: str, mongodb_uri: str, db_name: str
+) -> Iterator[list[str]]:
+    """Make the documents available to ISV, yielding the isv-run arguments that select them."""
+    if backend == Backend.EXPORT:
+        export_dir = os.path.join(work_dir, "export")
+        synthetic_db.write_export_dir(documents, export_dir)
+        yield ["--export_dir", export_dir]
+    elif backend == Backend.SNAPSHOT:
+        path = os.path.join(work_dir, "synthetic.isv")
+        snapshot.write_snapshot(path, documents, source_fingerprint="synthetic")
+        yield ["--snapshot", path]
+    elif backend == Backend.MONGODB:
+        synthetic_db.load_into_database(genovisio_sources_db.get_mongo_database(mongodb_uri, db_name), documents)
+        yield ["--mongodb_uri", mongodb_uri, "--db_name", db_name]
+    else:
+        try:
+            import mongomock
+        except ImportError as e:
+            raise ImportError(
+                "The mongomock backend requires mongomock, install it using `pip install mongomock`"
+            ) from e
+        db: Any = mongomock.MongoClient()[db_name]
+        synthetic_db.load_into_database(db, documents)
+        with mock.patch.object(genovisio_sources_db, "get_mongo_database", return_value=db):
+            yield ["--db_name", db_name]
+
+
+def build_collections_parser(backend_args: list[str]) -> genovisio_sources_db.CollectionsParser:
+    """The collections parser isv-run builds for the arguments."""
+    parser = argparse.ArgumentParser()
+    cli_args.add_database_arguments(parser)
+    cli_args.add_cache_arguments(parser)
+    return cli_args.build_collections_parser(parser, parser.parse_args(backend_args))
+
+
+def bench_annotate(
+    collection_parser: genovisio_sources_db.CollectionsParser, regions_by_size: dict[int, list[CNVRegion]]
+) -> tuple[list[dict[str, Any]], list[CNVAnnotation]]:
+    """Latency of annotate() per CNV size, with the mean number of documents and the time spent per stage."""
+    results = []
+    annotations = []
+    for size, regions in regions_by_size.items():
+        METRICS.pop_snapshot()
+        latencies = []
+        for region in regions:
+            start = time.perf_counter()
+            annotations.append(annotate(region=region, collection_parser=collection_parser))
+            latencies.append(time.perf_counter() - start)
+
+        histograms, counters = METRICS.pop_snapshot()
+        stages: dict[str, float] = {}
+        for (stage, labels), histogram in histograms.items():
+            name = "/".join([stage, *(value for _, value in labels)])
+            stages[name] = stages.get(name, 0.0) + histogram.total / len(regions)
+        documents = sum(value for (name, _), value in counters.items() if name == "query_documents")
+        results.append(
+            {
+                "size": size,
+                **summarize(latencies),
+                "mean_documents": documents / len(regions),
+                "mean_stage_seconds": dict(sorted(stages.items())),
+            }
+        )
+        print(f"annotate {size=}: {results[-1]['p50_seconds']:.4f} s median", file=sys.stderr)
+    return results, annotations
+
+
+def bench_predict(
+    annotations: list[CNVAnnotation], batch_sizes: list[int], repeats: int, shap_mode: ShapMode
+) -> list[dict[str, Any]]:
+    """Latency of predict_many() per batch size, with warm models."""
+    MODEL_REGISTRY.warm(explain=shap_mode == ShapMode.FULL)
+    results = []
+    for batch_size in batch_sizes:
+        batch = list(itertools.islice(itertools.cycle(annotations), batch_size))
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            predict_many(batch, shap_mode)
+            latencies.append(time.perf_counter() - start)
+        results.append({"batch_size": batch_size, **summarize(latencies, batch_size)})
+        print(f"predict {batch_size=}: {results[-1]['throughput_per_second']:.1f} CNVs/s", file=sys.stderr)
+    return results
+
+
+def bench_run(
+    backend_args: list[str], regions: list[CNVRegion], batch_sizes: list[int], work_dir: str, shap_mode: ShapMode
+) -> list[dict[str, Any]]:
+    """Wall time of isv-run --input_file over batches of CNVs of all sizes, run in this process (warm imports)."""
+    results = []
+    input_file = os.path.join(work_dir, "cnvs.bed")
+    for batch_size in batch_sizes:
+        with open(input_file, "w") as f:
+            for region in itertools.islice(itertools.cycle(regions), batch_size):
+                f.write(f"{region.chr}\t{region.start - 1}\t{region.end}\t{region.cnv_type}\n")
+
+        argv = ["isv-run", "--input_file", input_file, "--output", os.path.join(work_dir, "results.jsonl")]
+        argv += ["--shap", shap_mode, *backend_args]
+        with mock.patch.object(sys, "argv", argv):
+            start = time.perf_counter()
+            isv_main.main()
+            latency = time.perf_counter() - start
+        results.append({"batch_size": batch_size, **summarize([latency], batch_size)})
+        print(f"isv-run {batch_size=}: {results[-1]['throughput_per_second']:.1f} CNVs/s", file=sys.stderr)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark ISV over a synthetic Genovisio database.")
+    parser.add_argument("--output", help="Path to store the results JSON. Else prints to stdout.", default=None)
+    parser.add_argument(
+        "--backend",
+        help="Where the synthetic documents are queried",
+        choices=list(Backend),
+        type=Backend,
+        default=Backend.EXPORT,
+    )
+    parser.add_argument("--mongodb_uri", help="MongoDB for the mongodb backend", default="mongodb://localhost:27017/")
+    parser.add_argument(
+        "--db_name", help="Database to (re)create for the mongodb and mongomock backends", default="isv_benchmark"
+    )
+    parser.add_argument("--chromosomes", help="Chromosomes to generate", nargs="+", default=["chr1"])
+    parser.add_argument("--chromosome_length", help="Length of each chromosome", type=int, default=100_000_000)
+    parser.add_argument("--scale", help="Multiplier of the realistic document densities", type=float, default=1.0)
+    parser.add_argument("--seed", help="Seed of the documents and CNVs", type=int, default=0)
+    parser.add_argument("--sizes", help="CNV sizes to annotate", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeats", help="CNVs per size, and calls per predict batch size", type=int, default=10)
+    parser.add_argument("--batch_sizes", help="Predict batch sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES)
+    parser.add_argument(
+        "--run_batch_sizes", help="Numbers of CNVs per isv-run", type=int, nargs="+", default=DEFAULT_RUN_BATCH_SIZES
+    )
+    add_shap_argument(parser)
+    args = parser.parse_args()
+
+    documents = synthetic_db.generate_documents(args.chromosomes, args.chromosome_length, args.scale, args.seed)
+    rng = np.random.default_rng(args.seed)
+    regions_by_size = {
+        size: random_regions(rng, args.chromosomes, args.chromosome_length, size, args.repeats) for size in args.sizes
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        with prepare_backend(args.backend, documents, work_dir, args.mongodb_uri, args.db_name) as backend_args:
+            METRICS.enabled = True
+            collection_parser = build_collections_parser(backend_args)
+            annotate_results, annotations = bench_annotate(collection_parser, regions_by_size)
+            METRICS.enabled = False
+            predict_results = bench_predict(annotations, args.batch_sizes, args.repeats, args.shap)
+            all_regions = [region for regions in regions_by_size.values() for region in regions]
+            run_results = bench_run(backend_args, all_regions, args.run_batch_sizes, work_dir, args.shap)
+
+    results = {
+        "meta": {
+            "created": datetime.datetime.now(datetime.UTC).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "arguments": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "database": {name: len(collection_documents) for name, collection_documents in documents.items()},
+        "annotate": annotate_results,
+        "predict": predict_results,
+        "run": run_results,
+    }
+    stream: ContextManager[TextIO]
+    if args.output:
+        stream = open(args.output, "w")
+    else:
+        stream = contextlib.nullcontext(sys.stdout)
+    with stream as f:
+        json.dump(results, f, indent=2, default=str)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Latency of serializing and parsing annotations and predictions with long gene lists, stored as JSON.
+
+Compares the former asdict() and json path with to_dict() and isv.src.serialization, by both of its backends if orjson is
+installed. Run from the repository root, e.g. `python -m benchmarks.serialization --output serialization.json`.
+"""
+
+import argparse
+import contextlib
+import dataclasses
+import json
+import sys
+import time
+from typing import Any, Callable, ContextManager, TextIO
+from unittest import mock
+
+from benchmarks.run import summarize
+from isv.annotate import AnnotationsReporting, CNVAnnotation, ISVAnnotValues
+from isv.predict import PREDICTION_THRESHOLD_SCHEMES, ACMGClassification, Prediction
+from isv.src import constants, serialization
+from isv.src.cnv_region import CNVRegion, CNVType
+
+DEFAULT_GENE_COUNTS = [10, 1_000, 10_000]
+
+
+def build_record(gene_count: int) -> tuple[CNVAnnotation, Prediction]:
+    """Annotation with gene_count genes in each reported list, and a prediction with all SHAP values."""
+    genes = [f"GENE{i}" for i in range(gene_count)]
+    annotation = CNVAnnotation(
+        cnv=CNVRegion(chr="chr1", start=1_000_000, end=51_000_000, cnv_type=CNVType.GAIN),
+        isv_annot_values=ISVAnnotValues(**{field.name: gene_count for field in dataclasses.fields(ISVAnnotValues)}),
+        annotations_reporting=AnnotationsReporting(
+            TS_genes=genes,
+            HI_genes=genes,
+            morbid_genes=genes,
+            disease_associated_genes=genes,
+            protein_coding_genes_count=gene_count,
+            TS_genes_count=gene_count,
+            HI_genes_count=gene_count,
+            morbid_genes_count=gene_count,
+            disease_associated_genes_count=gene_count,
+        ),
+    )
+    prediction = Prediction(
+        isv_prediction=0.987654321,
+        isv_score=0.975308642,
+        isv_classification=ACMGClassification.PATHOGENIC,
+        isv_threshold_classifications={name: ACMGClassification.PATHOGENIC for name in PREDICTION_THRESHOLD_SCHEMES},
+        isv_shap_values={attribute: 0.123456789 for attribute in constants.GAIN_ATTRIBUTES},
+        isv_shap_scores={attribute: 0.0123456789 for attribute in constants.GAIN_ATTRIBUTES},
+    )
+    return annotation, prediction
+
+
+def measure(function: Callable[[], Any], repeats: int) -> list[float]:
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_serialization(gene_counts: list[int], repeats: int) -> list[dict[str, Any]]:
+    backends = [serialization.BACKEND] if serialization.BACKEND == "json" else ["json", serialization.BACKEND]
+    results: list[dict[str, Any]] = []
+    for gene_count in gene_counts:
+        annotation, prediction = build_record(gene_count)
+        encoded = json.dumps(dataclasses.asdict(annotation))
+        cases: dict[str, Callable[[], Any]] = {
+            "dumps asdict json": lambda: json.dumps(
+                {"annotation": dataclasses.asdict(annotation), "prediction": dataclasses.asdict(prediction)}
+            ),
+            "dumps_pretty asdict json": lambda: json.dumps(dataclasses.asdict(annotation), indent=2),
+            "loads json": lambda: CNVAnnotation.from_dict(json.loads(encoded)),
+        }
+        for backend in backends:
+            cases[f"dumps to_dict {backend}"] = lambda: serialization.dumps(
+                {"annotation": annotation.to_dict(), "prediction": prediction.to_dict()}
+            )
+            cases[f"dumps_pretty to_dict {backend}"] = lambda: serialization.dumps(annotation.to_dict(), pretty=True)
+            cases[f"loads {backend}"] = lambda: CNVAnnotation.from_dict(serialization.loads(encoded))
+
+        for name, function in cases.items():
+            backend = name.split()[-1]
+            # the json backend is measured by hiding orjson from isv.src.serialization
+            hidden: ContextManager[Any]
+            if backend == "json":
+                hidden = mock.patch.object(serialization, "orjson", None)
+            else:
+                hidden = contextlib.nullcontext()
+            with hidden:
+                latencies = measure(function, repeats)
+            results.append({"case": f"{name} genes={gene_count}", **summarize(latencies)})
+            print(f"{results[-1]['case']}: {results[-1]['p50_seconds'] * 1e6:.1f} us", file=sys.stderr)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the JSON serialization of ISV results.")
+    parser.add_argument("--output", help="Path to store the results JSON. Else prints to stdout.", default=None)
+    parser.add_argument(
+        "--gene_counts", help="Genes per reported list", type=int, nargs="+", default=DEFAULT_GENE_COUNTS
+    )
+    parser.add_argument("--repeats", help="Calls per case", type=int, default=100)
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "backend": serialization.BACKEND,
+            "arguments": {"gene_counts": args.gene_counts, "repeats": args.repeats},
+        },
+        "serialization": bench_serialization(args.gene_counts, args.repeats),
+    }
+    stream: ContextManager[TextIO]
+    if args.output:
+        stream = open(args.output, "w")
+    else:
+        stream = contextlib.nullcontext(sys.stdout)
+    with stream as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
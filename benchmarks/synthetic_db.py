@@ -0,0 +1,175 @@
+"""Synthetic Genovisio database with the density and field distributions of the real collections (GRCh38)."""
+
+import argparse
+import os
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+from bson import ObjectId, json_util
+
+from isv.src import constants
+
+Documents = dict[str, list[dict[str, Any]]]
+
+
+@dataclass
+class CollectionProfile:
+    """Documents per Mb, lognormal length (median in bp and sigma) and the distributions of the counted fields."""
+
+    per_mb: float
+    median_length: int
+    length_sigma: float
+    fields: dict[str, dict[Any, float]] = field(default_factory=dict)
+
+
+# ~62k GENCODE genes, ~1.6k ClinGen dosage genes, ~600 ClinGen regions and ~450k regulatory features in 3.1 Gb
+PROFILES = {
+    "Genes": CollectionProfile(
+        per_mb=20,
+        median_length=12_000,
+        length_sigma=1.3,
+        fields={
+            "gene_type": {
+                "protein_coding": 0.32,
+                "lncrna": 0.30,
+                "processed_pseudogene": 0.17,
+                "unprocessed_pseudogene": 0.04,
+                "transcribed_unprocessed_pseudogene": 0.02,
+                "misc_rna": 0.035,
+                "snrna": 0.03,
+                "mirna": 0.03,
+                "snorna": 0.015,
+                "rrna": 0.01,
+                "tec": 0.03,
+            }
+        },
+    ),
+    "HI_gene": CollectionProfile(
+        per_mb=0.5,
+        median_length=40_000,
+        length_sigma=1.2,
+        fields={
+            "Haploinsufficiency Score": {0: 0.45, 1: 0.1, 2: 0.05, 3: 0.22, 30: 0.15, 40: 0.03},
+            "Triplosensitivity Score": {"0": 0.6, "1": 0.03, "2": 0.02, "3": 0.02, "30": 0.3, "40": 0.03},
+        },
+    ),
+    "HI_region": CollectionProfile(
+        per_mb=0.2,
+        median_length=500_000,
+        length_sigma=1.0,
+        fields={
+            "Haploinsufficiency Score": {0: 0.3, 1: 0.15, 2: 0.1, 3: 0.3, 30: 0.05, 40: 0.05, "": 0.05},
+            "Triplosensitivity Score": {"0": 0.3, "1": 0.15, "2": 0.05, "3": 0.1, "40": 0.1, "Not yet evaluated": 0.3},
+        },
+    ),
+    "Regulatory": CollectionProfile(
+        per_mb=150,
+        median_length=800,
+        length_sigma=0.9,
+        fields={
+            "type": {
+                "enhancer": 0.35,
+                "promoter": 0.1,
+                "open_chromatin_region": 0.2,
+                "CTCF_binding_site": 0.15,
+                "TF_binding_site": 0.08,
+                "flanking_region": 0.05,
+                "silencer": 0.02,
+                "transcriptional_cis_regulatory_region": 0.02,
+                "DNase_I_hypersensitive_site": 0.015,
+                "enhancer_blocking_element": 0.005,
+                "TATA_box": 0.005,
+                "regulatory_curated": 0.005,
+            }
+        },
+    ),
+}
+
+MORBID_GENE_FRACTION = 0.07
+PHENOTYPE_GENE_FRACTION = 0.08
+
+
+def choose(rng: np.random.Generator, distribution: dict[Any, float], size: int) -> list[Any]:
+    values = list(distribution)
+    weights = np.array(list(distribution.values()))
+    return [values[i] for i in rng.choice(len(values), size=size, p=weights / weights.sum())]
+
+
+def generate_collection(
+    rng: np.random.Generator, name: str, profile: CollectionProfile, chromosomes: list[str], length: int, scale: float
+) -> list[dict[str, Any]]:
+    documents = []
+    for chromosome in chromosomes:
+        size = int(profile.per_mb * scale * length / 1_000_000)
+        lengths = np.clip(rng.lognormal(np.log(profile.median_length), profile.length_sigma, size), 50, length // 2)
+        starts = np.sort(rng.integers(1, length, size))
+        ends = np.minimum(starts + lengths.astype(np.int64), length)
+        values = {field_name: choose(rng, distribution, size) for field_name, distribution in profile.fields.items()}
+        morbid = rng.random(size) < MORBID_GENE_FRACTION
+        phenotype = rng.random(size) < PHENOTYPE_GENE_FRACTION
+
+        for i in range(size):
+            doc: dict[str, Any] = {"chromosome": chromosome, "start": int(starts[i]), "end": int(ends[i])}
+            doc.update({field_name: field_values[i] for field_name, field_values in values.items()})
+            if name == "Genes":
+                doc["gene_name"] = f"GENE_{chromosome}_{i}"
+                doc["AnnotSV"] = {}
+                if morbid[i]:
+                    doc["AnnotSV"]["omim_morbid_gene"] = "yes"
+                if phenotype[i]:
+                    doc["AnnotSV"]["omim_phenotype"] = f"Phenotype {i}"
+            elif name == "HI_gene":
+                doc["Gene Symbol"] = f"HI_{chromosome}_{i}"
+            documents.append(doc)
+    return documents
+
+
+def generate_documents(
+    chromosomes: list[str], length: int = 100_000_000, scale: float = 1.0, seed: int = 0
+) -> Documents:
+    """Documents of the annotation collections on the chromosomes of the given length, with deterministic ids."""
+    rng = np.random.default_rng(seed)
+    documents = {
+        name: generate_collection(rng, name, profile, chromosomes, length, scale) for name, profile in PROFILES.items()
+    }
+    next_id = 0
+    for name in constants.ANNOTATION_COLLECTION_NAMES:
+        for doc in documents[name]:
+            doc["_id"] = ObjectId(f"{next_id:024x}")
+            next_id += 1
+    return documents
+
+
+def write_export_dir(documents: Documents, export_dir: str) -> None:
+    """Store the documents as `mongoexport` would, see IntervalIndexCollectionsParser.from_export_dir."""
+    os.makedirs(export_dir, exist_ok=True)
+    for name, collection_documents in documents.items():
+        with open(os.path.join(export_dir, f"{name}.json"), "w") as f:
+            for doc in collection_documents:
+                f.write(json_util.dumps(doc) + "\n")
+
+
+def load_into_database(db: Any, documents: Documents) -> None:
+    """Replace the collections of the (pymongo or mongomock) database, with the indexes the queries rely on."""
+    for name, collection_documents in documents.items():
+        db.drop_collection(name)
+        db[name].insert_many(collection_documents)
+        db[name].create_index([("chromosome", 1), ("start", 1), ("end", 1)])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Genovisio database as a mongoexport directory.")
+    parser.add_argument("export_dir", help="Directory to store the <collection>.json files")
+    parser.add_argument("--chromosomes", help="Chromosomes to generate", nargs="+", default=["chr1"])
+    parser.add_argument("--chromosome_length", help="Length of each chromosome", type=int, default=100_000_000)
+    parser.add_argument("--scale", help="Multiplier of the realistic document densities", type=float, default=1.0)
+    parser.add_argument("--seed", help="Seed of the generator", type=int, default=0)
+    args = parser.parse_args()
+
+    documents = generate_documents(args.chromosomes, args.chromosome_length, args.scale, args.seed)
+    write_export_dir(documents, args.export_dir)
+
+
+if __name__ == "__main__":
+    main()
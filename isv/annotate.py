@@ -1,9 +1,26 @@
-import json
+import itertools
+import logging
 import os
 import sys
-from dataclasses import asdict, dataclass
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Iterable, Iterator
 
-from isv.src import annotators, cnv_region, genovisio_sources_db
+from isv.src import annotators, cnv_region, genovisio_sources_db, serialization
+from isv.src.annotators.annotated_sv import GenesDBAnnotatedTypes
+from isv.src.async_sources_db import AsyncCollectionsParser
+from isv.src.genovisio_sources_db import count_by, counts_from_facet
+from isv.src.instrumentation import (
+    METRICS,
+    add_logging_arguments,
+    add_profiling_arguments,
+    configure_logging_from_args,
+    enable_metrics_from_args,
+    log_duration,
+    write_reports_from_args,
+)
+from isv.src.sweep_line import SweepLine
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -30,7 +47,7 @@ class ISVAnnotValues:
     regulatory_TATA_box: int
 
     def as_dict_of_attributes(self) -> dict[str, int]:
-        return asdict(self)
+        return dict(vars(self))
 
 
 @dataclass
@@ -45,6 +62,10 @@ class AnnotationsReporting:
     morbid_genes_count: int
     disease_associated_genes_count: int
 
+    def to_dict(self) -> dict[str, Any]:
+        """Fields as a dict sharing the gene lists, unlike asdict which copies them."""
+        return dict(vars(self))
+
 
 @dataclass
 class CNVAnnotation:
@@ -87,11 +108,12 @@ class CNVAnnotation:
                 regulatory_enhancer_blocking_element=regulatory_counter.regulatory_enhancer_blocking_element,
                 regulatory_TATA_box=regulatory_counter.regulatory_TATA_box,
             ),
+            # sorted, so that the lists do not depend on the order the documents are returned in
             annotations_reporting=AnnotationsReporting(
-                HI_genes=hi_ts_genes.hi_genes_list,
-                TS_genes=hi_ts_genes.ts_genes_list,
-                morbid_genes=annot_sv.morbid_genes_list,
-                disease_associated_genes=annot_sv.disease_associated_genes_list,
+                HI_genes=sorted(hi_ts_genes.hi_genes_list),
+                TS_genes=sorted(hi_ts_genes.ts_genes_list),
+                morbid_genes=sorted(annot_sv.morbid_genes_list),
+                disease_associated_genes=sorted(annot_sv.disease_associated_genes_list),
                 protein_coding_genes_count=gene_type_counter.protein_coding,
                 HI_genes_count=len(hi_ts_genes.hi_genes_list),
                 TS_genes_count=len(hi_ts_genes.ts_genes_list),
@@ -100,69 +122,209 @@ class CNVAnnotation:
             ),
         )
 
+    def to_dict(self) -> dict[str, Any]:
+        """Same as asdict(self), without deep copying the gene lists."""
+        return {
+            "cnv": self.cnv.to_dict(),
+            "isv_annot_values": self.isv_annot_values.as_dict_of_attributes(),
+            "annotations_reporting": self.annotations_reporting.to_dict(),
+        }
+
     def store_as_json(self, path: str) -> None:
         path = os.path.abspath(path)
         if not os.path.exists(os.path.dirname(path)):
             os.makedirs(os.path.dirname(path), exist_ok=True)
         with open(path, "w") as f:
-            json.dump(asdict(self), f, indent=2)
+            f.write(serialization.dumps(self.to_dict(), pretty=True))
 
     @classmethod
-    def from_json(cls, path: str) -> "CNVAnnotation":
-        with open(path) as f:
-            data = json.load(f)
-        cnv_dct = data["cnv"]
-        cnv_dct.pop("length")
+    def from_dict(cls, data: dict[str, Any]) -> "CNVAnnotation":
+        cnv_dct = {key: value for key, value in data["cnv"].items() if key != "length"}
         return cls(
-            cnv=cnv_region.CNVRegion(**data["cnv"]),
+            cnv=cnv_region.CNVRegion(**cnv_dct),
             isv_annot_values=ISVAnnotValues(**data["isv_annot_values"]),
             annotations_reporting=AnnotationsReporting(**data["annotations_reporting"]),
         )
 
+    @classmethod
+    def from_json(cls, path: str) -> "CNVAnnotation":
+        with open(path, "rb") as f:
+            data = serialization.loads(f.read())
+        return cls.from_dict(data)
+
+
+def annotate_pipeline(region: cnv_region.CNVRegion, pipeline: annotators.AnnotationPipeline) -> CNVAnnotation:
+    """Annotate the region from a pipeline that has consumed all intersecting documents."""
+    for annotator, seconds in pipeline.annotator_seconds().items():
+        METRICS.observe("annotator", seconds, {"annotator": annotator})
+    return CNVAnnotation.build(
+        region=region,
+        gene_type_counter=pipeline.gene_type_counter(),
+        annot_sv=pipeline.annot_sv(),
+        hi_ts_genes=pipeline.hi_and_ts_genes(),
+        hi_regions_counter=pipeline.hi_regions_counter(),
+        ts_region_counter=pipeline.ts_regions_counter(),
+        regulatory_counter=pipeline.regulatory_counter(),
+    )
+
+
+def annotate_documents(region: cnv_region.CNVRegion, data: dict[str, list[dict[str, Any]]]) -> CNVAnnotation:
+    """Annotate the region from the intersecting documents of each collection."""
+    pipeline = annotators.AnnotationPipeline(timed=METRICS.enabled)
+    genovisio_sources_db.stream_documents(data, pipeline.consumers)
+    return annotate_pipeline(region, pipeline)
+
 
 def annotate(
+    *,
+    region: cnv_region.CNVRegion,
+    collection_parser: genovisio_sources_db.CollectionsParser,
+) -> CNVAnnotation:
+    """Annotate the region in a single pass over the intersecting documents, streamed from the collections parser."""
+    with log_duration(logger, "annotate", region=region.name) as fields:
+        pipeline = annotators.AnnotationPipeline(timed=METRICS.enabled)
+        collection_parser.stream_for_region(region, pipeline.consumers)
+        fields["documents"] = pipeline.document_counts()
+        return annotate_pipeline(region, pipeline)
+
+
+def annotate_chromosome(
+    regions: list[cnv_region.CNVRegion], collection_parser: genovisio_sources_db.CollectionsParser
+) -> list[CNVAnnotation]:
+    """Annotate regions of one chromosome by sweeping a single ordered scan of each collection over their span."""
+    span = replace(regions[0], start=min(region.start for region in regions), end=max(region.end for region in regions))
+    order = sorted(range(len(regions)), key=lambda i: regions[i].start)
+    pipelines = [annotators.AnnotationPipeline(timed=METRICS.enabled) for _ in regions]
+    with log_duration(logger, "annotate_sweep", chromosome=span.chr, cnvs=len(regions)) as fields:
+        for collection_name in pipelines[0].consumers:
+            check_type = collection_name in collection_parser.check_type_names
+            with log_duration(logger, "query", labels={"collection": collection_name}) as query_fields:
+                sweep = SweepLine(collection_parser.scan_sorted(collection_name, span))
+                for i in order:
+                    documents = sweep.intersections(regions[i])
+                    if check_type:
+                        documents = [doc for doc in documents if doc.get("cnv_type") == regions[i].cnv_type]
+                    pipelines[i].consume(collection_name, documents)
+                query_fields["documents"] = sweep.scanned
+        fields["documents"] = sum(sum(pipeline.document_counts().values()) for pipeline in pipelines)
+    return [annotate_pipeline(region, pipeline) for region, pipeline in zip(regions, pipelines)]
+
+
+def annotate_sorted(
+    regions: Iterable[cnv_region.CNVRegion], collection_parser: genovisio_sources_db.CollectionsParser
+) -> Iterator[CNVAnnotation]:
+    """Annotate the regions as annotate() does, in input order, with one sorted scan per collection and chromosome.
+
+    Consecutive regions of the same chromosome are annotated together by a sweep line, so for CNVs sorted by chromosome
+    each chromosome is scanned once, however many CNVs overlap there.
+    """
+    for _, chromosome_regions in itertools.groupby(regions, key=lambda region: region.chr):
+        yield from annotate_chromosome(list(chromosome_regions), collection_parser)
+
+
+async def annotate_async(
+    *,
+    region: cnv_region.CNVRegion,
+    collection_parser: AsyncCollectionsParser,
+) -> CNVAnnotation:
+    """Same as annotate(), awaiting the documents from an asyncio collections parser."""
+    with log_duration(logger, "annotate", region=region.name) as fields:
+        data = await collection_parser.get_for_region(region)
+        fields["documents"] = {collection_name: len(documents) for collection_name, documents in data.items()}
+        return annotate_documents(region, data)
+
+
+_ANNOTATED_SV_FIELDS = [
+    f"AnnotSV.{GenesDBAnnotatedTypes.OMIM_MORBID_GENE}",
+    f"AnnotSV.{GenesDBAnnotatedTypes.OMIM_PHENOTYPE}",
+]
+_HI_TS_GENE_FIELDS = ["Haploinsufficiency Score", "Triplosensitivity Score"]
+
+# Server-side counterparts of the annotators in annotate(), returning counts and only the documents of reported genes
+PUSHDOWN_FACETS: dict[str, dict[str, list[dict[str, Any]]]] = {
+    "Genes": {
+        "gene_type": count_by("gene_type"),
+        "annotated_sv": [
+            {"$match": {"$or": [{field: {"$exists": True}} for field in _ANNOTATED_SV_FIELDS]}},
+            {"$project": {field: 1 for field in [GenesDBAnnotatedTypes.GENE_NAME, *_ANNOTATED_SV_FIELDS]}},
+        ],
+    },
+    "HI_gene": {
+        "hi_score": count_by("Haploinsufficiency Score"),
+        "hi_ts_genes": [
+            {
+                "$match": {
+                    "$or": [
+                        {"Haploinsufficiency Score": {"$in": annotators.HI_GENE_SCORES}},
+                        {"Triplosensitivity Score": {"$in": annotators.TS_GENE_SCORES}},
+                    ]
+                }
+            },
+            {"$project": {field: 1 for field in ["Gene Symbol", *_HI_TS_GENE_FIELDS]}},
+        ],
+    },
+    "HI_region": {
+        "hi_score": count_by("Haploinsufficiency Score"),
+        "ts_score": count_by("Triplosensitivity Score"),
+    },
+    "Regulatory": {
+        "type": count_by("type"),
+    },
+}
+
+
+def annotate_pushdown(
     *,
     region: cnv_region.CNVRegion,
     collection_parser: genovisio_sources_db.IntersectionCollectionsParser,
 ) -> CNVAnnotation:
-    data = collection_parser.get_for_region(region)
+    """Same as annotate(), but the documents are counted by MongoDB, so memory and transfer do not grow with CNV size."""
+    with log_duration(logger, "annotate_pushdown", region=region.name):
+        facets = collection_parser.facet_for_region(region, PUSHDOWN_FACETS)
     return CNVAnnotation.build(
         region=region,
-        gene_type_counter=annotators.count_gene_types(data["Genes"], "gene_type"),
-        annot_sv=annotators.count_annotated_sv(data["Genes"], "AnnotSV"),
-        hi_ts_genes=annotators.count_hi_genes(data["HI_gene"], "Haploinsufficiency Score"),
-        hi_regions_counter=annotators.count_hi_regions(data["HI_region"], "Haploinsufficiency Score"),
-        ts_region_counter=annotators.count_ts_regions(data["HI_region"], "Triplosensitivity Score"),
-        regulatory_counter=annotators.count_regulatory_types(data["Regulatory"], "type"),
+        gene_type_counter=annotators.gene_types_from_counts(counts_from_facet(facets["Genes"]["gene_type"])),
+        annot_sv=annotators.count_annotated_sv(facets["Genes"]["annotated_sv"], "AnnotSV"),
+        hi_ts_genes=annotators.hi_genes_from_counts(
+            counts_from_facet(facets["HI_gene"]["hi_score"]), facets["HI_gene"]["hi_ts_genes"]
+        ),
+        hi_regions_counter=annotators.hi_regions_from_counts(counts_from_facet(facets["HI_region"]["hi_score"])),
+        ts_region_counter=annotators.ts_regions_from_counts(counts_from_facet(facets["HI_region"]["ts_score"])),
+        regulatory_counter=annotators.regulatory_types_from_counts(counts_from_facet(facets["Regulatory"]["type"])),
     )
 
 
 def main() -> None:
     import argparse
 
-    from isv.src import constants
+    from isv.src import cli_args
 
     parser = argparse.ArgumentParser(description="Annotate CNV and/or find intersecting items in MongoDB collections.")
     parser.add_argument("input", help='Input string in the format "chr1:10000-20000/del"')
-    parser.add_argument("--mongodb_uri", help="MongoDB full URI", default="mongodb://localhost:27017/")
-    parser.add_argument("--db_name", help="MongoDB database name", default="genovisio")
+    cli_args.add_database_arguments(parser)
+    cli_args.add_cache_arguments(parser)
     parser.add_argument("--output", help="Path to store the annotation JSON. Else prints to stdout.", default=None)
+    add_logging_arguments(parser)
+    add_profiling_arguments(parser)
     args = parser.parse_args()
+    configure_logging_from_args(args)
+    enable_metrics_from_args(args)
 
     region = cnv_region.build_from_str(args.input)
 
-    collection_parser = genovisio_sources_db.IntersectionCollectionsParser(
-        uri=args.mongodb_uri,
-        db_name=args.db_name,
-        collection_names=constants.COLLECTION_NAMES,
-        check_type_names=constants.CHECK_TYPE_NAMES,
-    )
+    collection_parser = cli_args.build_collections_parser(parser, args)
 
-    annotation = annotate(region=region, collection_parser=collection_parser)
-    if args.output:
-        annotation.store_as_json(args.output)
-    else:
-        print(json.dumps(asdict(annotation), indent=2), file=sys.stdout)
+    annotate_func: Callable[..., CNVAnnotation] = annotate_pushdown if args.pushdown else annotate
+    annotation_cache = cli_args.build_annotation_cache(args, collection_parser)
+    if annotation_cache is not None:
+        annotate_func = annotation_cache.wrap(annotate_func)
+    annotation = annotate_func(region=region, collection_parser=collection_parser)
+    with log_duration(logger, "serialize"):
+        if args.output:
+            annotation.store_as_json(args.output)
+        else:
+            print(serialization.dumps(annotation.to_dict(), pretty=True), file=sys.stdout)
+    write_reports_from_args(args)
 
 
 if __name__ == "__main__":
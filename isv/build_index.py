@@ -0,0 +1,31 @@
+import logging
+
+from isv.src import cli_args, constants, genovisio_sources_db, snapshot
+from isv.src.instrumentation import add_logging_arguments, configure_logging_from_args
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a memory-mapped snapshot of the MongoDB collections for ISV.")
+    parser.add_argument("output", help="Path to store the snapshot file")
+    parser.add_argument("--mongodb_uri", help="MongoDB full URI", default="mongodb://localhost:27017/")
+    parser.add_argument("--db_name", help="MongoDB database name", default="genovisio")
+    cli_args.add_source_version_argument(parser)
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+
+    db = genovisio_sources_db.get_mongo_database(args.mongodb_uri, args.db_name)
+    fingerprint = snapshot.build_snapshot(
+        db, constants.ANNOTATION_COLLECTION_NAMES, constants.ANNOTATION_PROJECTIONS, args.output, args.source_version
+    )
+    logger.info(
+        "snapshot", extra={"fields": {"db_name": args.db_name, "source_fingerprint": fingerprint, "path": args.output}}
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import logging
+
+from isv.src import cnv_region, compiled_model, model_registry
+from isv.src.instrumentation import add_logging_arguments, configure_logging_from_args
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    import argparse
+
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Compile the ISV models into NumPy arrays scored without xgboost.")
+    parser.add_argument(
+        "--models_dir",
+        help="Directory with isv2_gain.json and isv2_loss.json models",
+        default=model_registry.DEFAULT_MODELS_DIR,
+    )
+    parser.add_argument(
+        "--output_dir", help="Directory to store the .npz files. Else the models directory.", default=None
+    )
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+
+    for cnvtype in cnv_region.CNVType:
+        booster = joblib.load(model_registry.format_model_path(cnvtype, args.models_dir))
+        output_path = model_registry.format_compiled_model_path(cnvtype, args.output_dir or args.models_dir)
+        compiled_model.compile_booster(booster).save(output_path)
+        logger.info("compile_model", extra={"fields": {"cnv_type": cnvtype, "path": output_path}})
+
+
+if __name__ == "__main__":
+    main()
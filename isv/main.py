@@ -1,43 +1,199 @@
 import argparse
-import json
+import itertools
+import logging
 import sys
-from dataclasses import asdict
+from typing import Callable, Iterable
 
-from isv.annotate import annotate
-from isv.predict import predict
-from isv.src import cnv_region, constants, genovisio_sources_db
+from isv.annotate import CNVAnnotation, annotate, annotate_pushdown, annotate_sorted
+from isv.predict import (
+    ShapMode,
+    add_models_arguments,
+    add_shap_argument,
+    configure_models_from_args,
+    predict,
+    predict_many,
+)
+from isv.src import batch_output, cli_args, cnv_input, cnv_region, parallel, serialization
+from isv.src.genovisio_sources_db import CollectionsParser
+from isv.src.incremental_cache import IncrementalCollectionsParser
+from isv.src.instrumentation import (
+    add_logging_arguments,
+    add_profiling_arguments,
+    configure_logging_from_args,
+    enable_metrics_from_args,
+    log_duration,
+    write_reports_from_args,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def run_batch(
+    annotations: Iterable[CNVAnnotation],
+    writer: batch_output.BatchWriter,
+    chunk_size: int = 256,
+    shap_mode: ShapMode = ShapMode.FULL,
+    on_chunk: Callable[[int], None] | None = None,
+) -> int:
+    """Predict annotations chunk by chunk, streaming results to the writer. Returns the number of CNVs.
+
+    on_chunk is called with the number of CNVs written so far after each chunk.
+    """
+    count = 0
+    for chunk in itertools.batched(annotations, chunk_size):
+        predictions = predict_many(chunk, shap_mode)
+        with log_duration(logger, "serialize", cnvs=len(chunk)):
+            for annotation, prediction in zip(chunk, predictions):
+                writer.write(annotation, prediction)
+        count += len(chunk)
+        if on_chunk is not None:
+            on_chunk(count)
+    return count
 
 
 def main() -> None:
     # Set up argument parsing
     parser = argparse.ArgumentParser(description="Classify CNV and/or find intersecting items in MongoDB collections.")
-    parser.add_argument("input", help='Input string in the format "chr1:10000-20000/del"')
-    parser.add_argument("--mongodb_uri", help="MongoDB full URI", default="mongodb://localhost:27017/")
-    parser.add_argument("--db_name", help="MongoDB database name", default="genovisio")
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument("input", nargs="?", help='Input string in the format "chr1:10000-20000/del"')
+    input_group.add_argument("--input_file", help="BED, VCF or TSV file with many CNVs to annotate and predict")
+    parser.add_argument(
+        "--input_format",
+        help="Format of --input_file. Else guessed from the file extension.",
+        choices=list(cnv_input.InputFormat),
+        default=None,
+    )
+    cli_args.add_database_arguments(parser)
+    cli_args.add_cache_arguments(parser)
     parser.add_argument("--annotation_output", help="Path to store the annotation JSON. Else stdout.", default=None)
     parser.add_argument("--prediction_output", help="Path to store the prediction JSON. Else stdout.", default=None)
+    parser.add_argument(
+        "--output",
+        help="Path to store the --input_file results. Else stdout (not for parquet and arrow).",
+        default=None,
+    )
+    parser.add_argument(
+        "--output_format",
+        help="Format of the --input_file results",
+        choices=list(batch_output.OutputFormat),
+        default=batch_output.OutputFormat.JSONL,
+    )
+    parser.add_argument(
+        "--jobs",
+        help="Number of parallel annotation jobs for --input_file (for asyncio, the number of queries in flight)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--parallel_backend",
+        help="Annotate --input_file in worker processes, each with its own MongoDB client, in threads, "
+        "or in one asyncio event loop (requires Motor)",
+        choices=list(parallel.ParallelBackend),
+        default=parallel.ParallelBackend.PROCESS,
+    )
+    parser.add_argument(
+        "--unordered", help="Write --input_file results as they are ready, not in input order", action="store_true"
+    )
+    parser.add_argument(
+        "--sweep",
+        help="Annotate --input_file sorted by chromosome with one sorted scan per collection and chromosome",
+        action="store_true",
+    )
+    add_models_arguments(parser)
+    add_shap_argument(parser)
+    add_logging_arguments(parser)
+    add_profiling_arguments(parser)
     args = parser.parse_args()
+    configure_logging_from_args(args)
+    enable_metrics_from_args(args)
 
-    region = cnv_region.build_from_str(args.input)
-    collection_parser = genovisio_sources_db.IntersectionCollectionsParser(
-        uri=args.mongodb_uri,
-        db_name=args.db_name,
-        collection_names=constants.COLLECTION_NAMES,
-        check_type_names=constants.CHECK_TYPE_NAMES,
-    )
+    configure_models_from_args(args)
+
+    if args.input_file and (args.annotation_output or args.prediction_output):
+        parser.error("--annotation_output and --prediction_output are for a single CNV, use --output for --input_file")
+
+    if args.sweep and (
+        args.pushdown
+        or cli_args.is_cache_enabled(args)
+        or args.incremental_cache_size
+        or args.jobs > 1
+        or args.parallel_backend == parallel.ParallelBackend.ASYNCIO
+    ):
+        parser.error("--sweep cannot be combined with --pushdown, caches, --jobs above 1 or the asyncio backend")
+
+    annotate_func: Callable[..., CNVAnnotation] = annotate_pushdown if args.pushdown else annotate
+    parser_factory = cli_args.collections_parser_factory(parser, args)
+
+    shared_parser: CollectionsParser | None = None
+    if args.parallel_backend == parallel.ParallelBackend.THREAD or (
+        args.parallel_backend == parallel.ParallelBackend.PROCESS and args.jobs <= 1
+    ):
+        # one parser in this process, built upfront so that its caches and source fingerprint are at hand
+        shared_parser = parser_factory()
 
-    annotation = annotate(region=region, collection_parser=collection_parser)
-    prediction = predict(annotation)
+        def shared_parser_factory() -> CollectionsParser:
+            assert shared_parser is not None
+            return shared_parser
+
+        parser_factory = shared_parser_factory
+
+    annotation_cache = None
+    if cli_args.is_cache_enabled(args) or args.incremental_cache_size:
+        if shared_parser is None:
+            parser.error("The caches require --parallel_backend thread when --jobs is above 1")
+        annotation_cache = cli_args.build_annotation_cache(args, shared_parser)
+        annotate_func = annotation_cache.wrap(annotate_func) if annotation_cache else annotate_func
+
+    if args.input_file:
+        if args.output_format in batch_output.COLUMNAR_FORMATS and not args.output:
+            parser.error(f"--output_format {args.output_format} requires --output")
+        regions = cnv_input.read_regions(args.input_file, args.input_format)
+        annotations: Iterable[CNVAnnotation]
+        if args.sweep:
+            annotations = annotate_sorted(regions, parser_factory())
+        elif args.parallel_backend == parallel.ParallelBackend.ASYNCIO:
+            annotations = parallel.annotate_many_asyncio(
+                regions,
+                cli_args.async_collections_parser_factory(parser, args, max_concurrency=args.jobs),
+                max_in_flight=args.jobs,
+                ordered=not args.unordered,
+            )
+        else:
+            annotations = parallel.annotate_many(
+                regions,
+                parser_factory,
+                annotate_func=annotate_func,
+                jobs=args.jobs,
+                backend=args.parallel_backend,
+                ordered=not args.unordered,
+            )
+        with (
+            batch_output.open_writer(args.output_format, args.output) as writer,
+            log_duration(logger, "run_batch", input_file=args.input_file) as fields,
+        ):
+            fields["cnvs"] = run_batch(annotations, writer, shap_mode=args.shap)
+        if annotation_cache is not None:
+            logger.info("annotation_cache", extra={"fields": annotation_cache.describe()})
+        if isinstance(shared_parser, IncrementalCollectionsParser):
+            logger.info("incremental_cache", extra={"fields": shared_parser.describe()})
+        write_reports_from_args(args)
+        return
+
+    region = cnv_region.build_from_str(args.input)
+    annotation = annotate_func(region=region, collection_parser=parser_factory())
+    prediction = predict(annotation, args.shap)
 
-    if args.annotation_output:
-        annotation.store_as_json(args.annotation_output)
-    else:
-        print(json.dumps(asdict(annotation), indent=2), file=sys.stdout)
+    with log_duration(logger, "serialize"):
+        if args.annotation_output:
+            annotation.store_as_json(args.annotation_output)
+        else:
+            print(serialization.dumps(annotation.to_dict(), pretty=True), file=sys.stdout)
 
-    if args.prediction_output:
-        prediction.store_as_json(args.prediction_output)
-    else:
-        print(json.dumps(asdict(prediction), indent=2), file=sys.stdout)
+        if args.prediction_output:
+            prediction.store_as_json(args.prediction_output)
+        else:
+            print(serialization.dumps(prediction.to_dict(), pretty=True), file=sys.stdout)
+    write_reports_from_args(args)
 
 
 if __name__ == "__main__":
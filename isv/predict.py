@@ -1,17 +1,29 @@
 import enum
-import json
+import logging
 import os
 import sys
-from dataclasses import asdict, dataclass
-from typing import Any
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Sequence, cast
 
-import joblib
-import pandas as pd
-import shap
-import xgboost as xgb
+import numpy as np
 
 from isv.annotate import CNVAnnotation
-from isv.src import cnv_region, constants
+from isv.src import cnv_region, constants, serialization
+from isv.src.annotation_table import CNV_TYPES, AnnotationTable
+from isv.src.instrumentation import (
+    add_logging_arguments,
+    add_profiling_arguments,
+    configure_logging_from_args,
+    enable_metrics_from_args,
+    log_duration,
+    write_reports_from_args,
+)
+from isv.src.model_registry import MODEL_REGISTRY
+
+if TYPE_CHECKING:
+    import argparse
+
+logger = logging.getLogger(__name__)
 
 
 class ACMGClassification(enum.StrEnum):
@@ -22,19 +34,12 @@ class ACMGClassification(enum.StrEnum):
     BENIGN = "Benign"
 
 
-def get_shap_values(loaded_model: Any, input_df: pd.DataFrame) -> dict[str, float]:
-    explainer_cnvs = shap.Explainer(loaded_model)
-    shap_values = explainer_cnvs(input_df).values[0]
-
-    return {attr: float(shap_val) for shap_val, attr in zip(shap_values, loaded_model.feature_names)}
-
-
-def get_shap_scores(shap_values: dict[str, float]) -> dict[str, float]:
-    shap_scores: dict[str, float] = {}
-    for attribute in shap_values.keys():
-        shap_scores[attribute] = shap_values[attribute] * 2 - 1
+class ShapMode(enum.StrEnum):
+    """How the SHAP values of a prediction are computed."""
 
-    return shap_scores
+    NONE = "none"  # skipped, SHAP values are left empty
+    FAST = "fast"  # XGBoost's native TreeSHAP (pred_contribs), without importing shap
+    FULL = "full"  # shap.TreeExplainer
 
 
 def get_class_threshold_0_5(prediction: float) -> ACMGClassification:
@@ -103,11 +108,72 @@ def get_acmg_classification(isv_score: float) -> ACMGClassification:
         return ACMGClassification.BENIGN
 
 
+def get_isv_scores(predictions: np.ndarray) -> np.ndarray:
+    return (predictions.astype(np.float64) * 2) - 1
+
+
+@dataclass(frozen=True)
+class ThresholdScheme:
+    """Classes separated by ascending cut points, e.g. classes[1] lies between cut_points[0] and cut_points[1].
+
+    A value equal to cut_points[i] falls into the upper class classes[i + 1] if upper_inclusive[i], else the lower one.
+    """
+
+    classes: tuple[ACMGClassification, ...]
+    cut_points: tuple[float, ...]
+    upper_inclusive: tuple[bool, ...]
+
+    def classify(self, values: np.ndarray) -> np.ndarray:
+        """Class of each value, as an object array of ACMGClassification."""
+        cut_points = np.asarray(self.cut_points)
+        upper_inclusive = np.asarray(self.upper_inclusive)
+        # the class index is the number of cut points the value has passed
+        indices = np.searchsorted(cut_points[upper_inclusive], values, side="right") + np.searchsorted(
+            cut_points[~upper_inclusive], values, side="left"
+        )
+        return np.array(self.classes, dtype=object)[indices]
+
+
+_FIVE_CLASSES = (
+    ACMGClassification.BENIGN,
+    ACMGClassification.LIKELY_BENIGN,
+    ACMGClassification.VOUS,
+    ACMGClassification.LIKELY_PATHOGENIC,
+    ACMGClassification.PATHOGENIC,
+)
+
+# Schemes over the ISV prediction, the counterparts of get_class_threshold_*
+PREDICTION_THRESHOLD_SCHEMES: dict[str, ThresholdScheme] = {
+    "threshold_0_5": ThresholdScheme(
+        classes=(ACMGClassification.BENIGN, ACMGClassification.VOUS, ACMGClassification.PATHOGENIC),
+        cut_points=(0.05, 0.95),
+        upper_inclusive=(True, False),
+    ),
+    "threshold_5_10": ThresholdScheme(_FIVE_CLASSES, (0.05, 0.1, 0.9, 0.95), (True, True, False, False)),
+    "threshold_10_20": ThresholdScheme(_FIVE_CLASSES, (0.1, 0.2, 0.8, 0.9), (True, True, False, False)),
+    "threshold_25_50": ThresholdScheme(_FIVE_CLASSES, (0.25, 0.5, 0.5, 0.75), (True, True, False, False)),
+}
+
+# Scheme over the ISV score, the counterpart of get_acmg_classification
+ISV_SCORE_SCHEME = ThresholdScheme(_FIVE_CLASSES, (-0.99, -0.89, 0.9, 0.99), (False, True, True, True))
+
+
+def get_acmg_classifications(isv_scores: np.ndarray) -> list[ACMGClassification]:
+    """Vectorized get_acmg_classification over an array of ISV scores."""
+    return ISV_SCORE_SCHEME.classify(isv_scores).tolist()
+
+
+def get_threshold_classifications(predictions: np.ndarray) -> dict[str, np.ndarray]:
+    """Classes of the predictions under each of the PREDICTION_THRESHOLD_SCHEMES."""
+    return {name: scheme.classify(predictions) for name, scheme in PREDICTION_THRESHOLD_SCHEMES.items()}
+
+
 @dataclass
 class Prediction:
     isv_prediction: float
     isv_score: float
     isv_classification: ACMGClassification
+    isv_threshold_classifications: dict[str, ACMGClassification]
     isv_shap_values: dict[str, float]
     isv_shap_scores: dict[str, float]
 
@@ -116,13 +182,28 @@ class Prediction:
         if not os.path.exists(os.path.dirname(path)):
             os.makedirs(os.path.dirname(path), exist_ok=True)
         with open(path, "w") as f:
-            json.dump(asdict(self), f, indent=2)
+            f.write(serialization.dumps(self.to_dict(), pretty=True))
+
+    def to_dict(self) -> dict[str, Any]:
+        """Same as asdict(self), sharing the dicts of classifications and SHAP values instead of copying them."""
+        return dict(vars(self))
 
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Prediction":
+        return cls(
+            isv_prediction=data["isv_prediction"],
+            isv_score=data["isv_score"],
+            isv_classification=ACMGClassification(data["isv_classification"]),
+            isv_threshold_classifications={
+                name: ACMGClassification(value) for name, value in data["isv_threshold_classifications"].items()
+            },
+            isv_shap_values=data["isv_shap_values"],
+            isv_shap_scores=data["isv_shap_scores"],
+        )
 
-def format_model_path(cnvtype: cnv_region.CNVType) -> str:
-    models_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "models"))
-    models_name = f"isv2_{cnvtype}.json"
-    return os.path.join(models_dir, models_name)
+
+def load_model(cnvtype: cnv_region.CNVType) -> Any:
+    return MODEL_REGISTRY.get_model(cnvtype)
 
 
 def get_attributes(cnvtype: cnv_region.CNVType) -> list[str]:
@@ -134,70 +215,259 @@ def get_attributes(cnvtype: cnv_region.CNVType) -> list[str]:
         raise ValueError("Invalid CNV type")
 
 
-def prepare_dataframe(annotated_cnv: CNVAnnotation) -> pd.DataFrame:
-    attributes = get_attributes(annotated_cnv.cnv.cnv_type)
-
-    cnv_dct = annotated_cnv.isv_annot_values.as_dict_of_attributes()
-    annotated_cnv_floats = {col: float(cnv_dct[col]) for col in cnv_dct if col in attributes}
-    df = pd.DataFrame.from_dict(annotated_cnv_floats, orient="index").T
-    return df[attributes]
+def prepare_matrix(annotated_cnvs: Sequence[CNVAnnotation], attributes: list[str]) -> np.ndarray:
+    return np.array(
+        [[getattr(annotated_cnv.isv_annot_values, attr) for attr in attributes] for annotated_cnv in annotated_cnvs],
+        dtype=np.float32,
+    ).reshape(len(annotated_cnvs), len(attributes))
+
+
+def build_dmatrix(matrix: np.ndarray, attributes: list[str]) -> Any:
+    import xgboost as xgb
+
+    return xgb.DMatrix(matrix, feature_names=attributes)
+
 
+def predict_matrix(cnvtype: cnv_region.CNVType, matrix: np.ndarray, dmatrix: Any) -> np.ndarray:
+    """Predictions of the rows of the matrix, by the compiled model if MODEL_REGISTRY.compiled, else from the dmatrix."""
+    if not MODEL_REGISTRY.compiled:
+        return load_model(cnvtype).predict(dmatrix)
 
-def predict(annotated_cnv: CNVAnnotation) -> Prediction:
-    model_path = format_model_path(annotated_cnv.cnv.cnv_type)
-    print(f"Loading model from {model_path=}", file=sys.stderr)
-    loaded_model = joblib.load(model_path)
-
-    input_df = prepare_dataframe(annotated_cnv)
+    compiled_model = MODEL_REGISTRY.get_compiled_model(cnvtype)
+    if compiled_model.feature_names != get_attributes(cnvtype):
+        raise ValueError(f"Features of the compiled {cnvtype} model do not match the ISV attributes")
+    return compiled_model.predict(matrix)
+
+
+def get_explained_iteration_range(loaded_model: Any) -> tuple[int, int]:
+    """Trees explained by shap.TreeExplainer, which stops at the best iteration of early stopping (if recorded)."""
+    best_iteration = loaded_model.attr("best_iteration")
+    return (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+
+
+def get_shap_matrix(cnvtype: cnv_region.CNVType, matrix: np.ndarray, dmatrix: Any, shap_mode: ShapMode) -> np.ndarray:
+    """SHAP values of the rows of the matrix (dmatrix holds the same data), one column per attribute."""
+    if shap_mode == ShapMode.NONE:
+        return np.empty((len(matrix), 0))
+
+    if shap_mode == ShapMode.FAST:
+        loaded_model = load_model(cnvtype)
+        contributions = loaded_model.predict(
+            dmatrix, pred_contribs=True, iteration_range=get_explained_iteration_range(loaded_model)
+        )
+        return contributions[:, :-1].astype(np.float64)  # the last column holds the bias
+
+    return MODEL_REGISTRY.get_explainer(cnvtype).shap_values(matrix).astype(np.float64)
+
+
+def get_indices_by_type(
+    annotated_cnvs: Sequence[CNVAnnotation] | AnnotationTable,
+) -> dict[cnv_region.CNVType, list[int]]:
+    if isinstance(annotated_cnvs, AnnotationTable):
+        cnv_types = annotated_cnvs.cnv_types
+        return {
+            cnvtype: np.flatnonzero(cnv_types == code).tolist()
+            for code, cnvtype in enumerate(CNV_TYPES)
+            if np.any(cnv_types == code)
+        }
+
+    indices_by_type: dict[cnv_region.CNVType, list[int]] = {}
+    for i, annotated_cnv in enumerate(annotated_cnvs):
+        indices_by_type.setdefault(annotated_cnv.cnv.cnv_type, []).append(i)
+    return indices_by_type
+
+
+def predict_many(
+    annotated_cnvs: Sequence[CNVAnnotation] | AnnotationTable, shap_mode: ShapMode = ShapMode.FULL
+) -> list[Prediction]:
+    """Predict many CNVs at once, using one DMatrix and one SHAP pass per CNV type. Keeps the input order.
+
+    An AnnotationTable is predicted from its columns, without building its rows. The compiled models need no DMatrix,
+    unless for the fast SHAP values.
+    """
+    predictions: list[Prediction | None] = [None] * len(annotated_cnvs)
+
+    for cnvtype, indices in get_indices_by_type(annotated_cnvs).items():
+        attributes = get_attributes(cnvtype)
+        if isinstance(annotated_cnvs, AnnotationTable):
+            matrix = annotated_cnvs.matrix(attributes, np.asarray(indices))
+        else:
+            matrix = prepare_matrix([annotated_cnvs[i] for i in indices], attributes)
+        logger.debug("cnv_type=%s matrix=%s", cnvtype, matrix)
+
+        labels: dict[str, str] = {"cnv_type": cnvtype}
+        dmatrix = None
+        if not MODEL_REGISTRY.compiled or shap_mode == ShapMode.FAST:
+            with log_duration(logger, "dmatrix", labels):
+                dmatrix = build_dmatrix(matrix, attributes)
+
+        with log_duration(logger, "predict", labels, cnvs=len(indices)):
+            prediction_cnvs = predict_matrix(cnvtype, matrix, dmatrix)
+            isv_scores = get_isv_scores(prediction_cnvs)
+            classifications = get_acmg_classifications(isv_scores)
+            threshold_classifications = get_threshold_classifications(prediction_cnvs)
+
+        with log_duration(logger, "shap", {**labels, "shap_mode": shap_mode}):
+            shap_matrix = get_shap_matrix(cnvtype, matrix, dmatrix, shap_mode)
+            shap_scores_matrix = shap_matrix * 2 - 1
+
+        for row, i in enumerate(indices):
+            predictions[i] = Prediction(
+                isv_prediction=prediction_cnvs[row].item(),
+                isv_score=isv_scores[row].item(),
+                isv_classification=classifications[row],
+                isv_threshold_classifications={
+                    name: classes[row] for name, classes in threshold_classifications.items()
+                },
+                isv_shap_values=dict(zip(attributes, shap_matrix[row].tolist())),
+                isv_shap_scores=dict(zip(attributes, shap_scores_matrix[row].tolist())),
+            )
+
+    # every index belongs to exactly one CNV type
+    assert all(prediction is not None for prediction in predictions)
+    return cast(list[Prediction], predictions)
+
+
+def predict(annotated_cnv: CNVAnnotation, shap_mode: ShapMode = ShapMode.FULL) -> Prediction:
+    return predict_many([annotated_cnv], shap_mode)[0]
+
+
+def add_shap_argument(parser: "argparse.ArgumentParser") -> None:
+    parser.add_argument(
+        "--shap",
+        help="Skip SHAP values, compute them natively by XGBoost (fast), or by the shap package (full, default)",
+        choices=list(ShapMode),
+        type=ShapMode,
+        default=ShapMode.FULL,
+    )
 
-    dmat_cnvs = xgb.DMatrix(input_df)
-    prediction_cnvs = loaded_model.predict(dmat_cnvs)  # TODO rework later/simplify
-    print(f"{prediction_cnvs=}", file=sys.stderr)
-    predictions_df = pd.DataFrame(prediction_cnvs, columns=["isv2_predictions"])
-    print(f"{predictions_df=}", file=sys.stderr)
-    predictions_df["isv2_prediction_2"] = (predictions_df["isv2_predictions"] > 0.5) * 1
 
-    # add class when using threshold
-    predictions_df["isv2_prediction_threshold_5_10"] = predictions_df["isv2_predictions"].apply(
-        get_class_threshold_5_10
-    )
-    predictions_df["isv2_prediction_threshold_10_20"] = predictions_df["isv2_predictions"].apply(
-        get_class_threshold_10_20
-    )
-    predictions_df["isv2_prediction_threshold_25_50"] = predictions_df["isv2_predictions"].apply(
-        get_class_threshold_25_50
+def add_models_arguments(parser: "argparse.ArgumentParser") -> None:
+    parser.add_argument("--models_dir", help="Directory with isv2_gain.json and isv2_loss.json models", default=None)
+    parser.add_argument(
+        "--compiled_models",
+        help="Predict by the isv2_gain.npz and isv2_loss.npz models compiled by isv-compile-models, without xgboost",
+        action="store_true",
     )
 
-    # isv score from prediction
-    predictions_df["isv2_score"] = predictions_df["isv2_predictions"].apply(get_isv_score)
-    predictions_df["isv2_classification"] = predictions_df["isv2_score"].apply(get_acmg_classification)
 
-    shap_values = get_shap_values(loaded_model, input_df)
-
-    return Prediction(
-        isv_prediction=predictions_df["isv2_predictions"].iloc[0].item(),
-        isv_score=predictions_df["isv2_score"].iloc[0].item(),
-        isv_classification=predictions_df["isv2_classification"].iloc[0],
-        isv_shap_values=shap_values,
-        isv_shap_scores=get_shap_scores(shap_values),
-    )
+def configure_models_from_args(args: "argparse.Namespace") -> None:
+    if args.models_dir:
+        MODEL_REGISTRY.set_models_dir(args.models_dir)
+    MODEL_REGISTRY.compiled = args.compiled_models
 
 
 def main() -> None:
     import argparse
 
+    from isv.src import annotation_input, arrow_io, batch_output, checkpoint
+
     parser = argparse.ArgumentParser(description="Predict pathogenicity from annotated CNV.")
-    parser.add_argument("input", help="Annotated CNV stored as json")
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument(
+        "input",
+        nargs="?",
+        help="Annotated CNV stored as json, or a .parquet/.arrow file of many (isv-run --output_format)",
+    )
+    input_group.add_argument("--input_dir", help="Directory of annotated CNVs stored as .json files", default=None)
+    input_group.add_argument(
+        "--input_jsonl", help="JSONL file of annotated CNVs, or of isv-run --output records", default=None
+    )
     parser.add_argument("--output", help="Path to store the prediction JSON. Else prints to stdout.", default=None)
+    parser.add_argument(
+        "--output_format",
+        help="Format of the results of many CNVs",
+        choices=list(batch_output.OutputFormat),
+        default=batch_output.OutputFormat.JSONL,
+    )
+    parser.add_argument("--chunk_size", help="CNVs of many predicted at once", type=int, default=256)
+    parser.add_argument(
+        "--checkpoint",
+        help="Checkpoint of an --input_dir or --input_jsonl run, resumed if it exists. Default <output>.checkpoint",
+        default=None,
+    )
+    add_models_arguments(parser)
+    add_shap_argument(parser)
+    add_logging_arguments(parser)
+    add_profiling_arguments(parser)
     args = parser.parse_args()
+    configure_logging_from_args(args)
+    enable_metrics_from_args(args)
+
+    configure_models_from_args(args)
+
+    if args.input_dir or args.input_jsonl:
+        from isv.main import run_batch
+
+        input_path = args.input_dir or args.input_jsonl
+        source_type: Callable[[str, int], annotation_input.AnnotationSource]
+        if args.input_dir:
+            source_type = annotation_input.DirectoryAnnotations
+        else:
+            source_type = annotation_input.JSONLAnnotations
+        source = source_type(input_path, 0)
+        resumable = args.output is not None and args.output_format not in batch_output.COLUMNAR_FORMATS
+        if args.checkpoint and not resumable:
+            parser.error("--checkpoint requires --output in the jsonl or tsv --output_format")
+        if args.output_format in batch_output.COLUMNAR_FORMATS and not args.output:
+            parser.error(f"--output_format {args.output_format} requires --output")
+
+        with log_duration(logger, "run_batch", input_file=input_path) as fields:
+            if not resumable:
+                with batch_output.open_writer(args.output_format, args.output) as writer:
+                    fields["cnvs"] = run_batch(source, writer, args.chunk_size, args.shap)
+            else:
+                checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+                settings = {
+                    "input": os.path.abspath(input_path),
+                    "output_format": str(args.output_format),
+                    "shap": str(args.shap),
+                    "models_dir": os.path.abspath(MODEL_REGISTRY.models_dir),
+                    "compiled_models": MODEL_REGISTRY.compiled,
+                    # the offset applies only to the same files, unchanged since
+                    "input_checksum": source.checksum,
+                }
+                try:
+                    state = checkpoint.restore(checkpoint_path, settings, args.output)
+                except ValueError as e:
+                    parser.error(str(e))
+                if state.records:
+                    logger.warning("Resuming from %s after %d CNVs", checkpoint_path, state.records)
+                source.offset = state.input_offset
+                fields["cnvs"] = checkpoint.run_resumable(
+                    source,
+                    args.output,
+                    args.output_format,
+                    state,
+                    checkpoint_path,
+                    args.chunk_size,
+                    args.shap,
+                )
+        write_reports_from_args(args)
+        return
+
+    if arrow_io.guess_format(args.input) is not None:
+        from isv.main import run_batch
+
+        if args.output_format in batch_output.COLUMNAR_FORMATS and not args.output:
+            parser.error(f"--output_format {args.output_format} requires --output")
+        with (
+            batch_output.open_writer(args.output_format, args.output) as writer,
+            log_duration(logger, "run_batch", input_file=args.input) as fields,
+        ):
+            fields["cnvs"] = run_batch(arrow_io.read_annotations(args.input), writer, args.chunk_size, args.shap)
+        write_reports_from_args(args)
+        return
 
     annotation = CNVAnnotation.from_json(args.input)
-    prediction = predict(annotation)
-
-    if args.output:
-        prediction.store_as_json(args.output)
-    else:
-        print(json.dumps(asdict(prediction), indent=2), file=sys.stdout)
+    prediction = predict(annotation, args.shap)
+
+    with log_duration(logger, "serialize"):
+        if args.output:
+            prediction.store_as_json(args.output)
+        else:
+            print(serialization.dumps(prediction.to_dict(), pretty=True), file=sys.stdout)
+    write_reports_from_args(args)
 
 
 if __name__ == "__main__":
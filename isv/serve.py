@@ -0,0 +1,184 @@
+import argparse
+import logging
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+from isv.annotate import CNVAnnotation, annotate, annotate_pushdown
+from isv.predict import ShapMode, add_models_arguments, add_shap_argument, configure_models_from_args, predict_many
+from isv.src import cli_args, cnv_region, genovisio_sources_db, parallel, serialization
+from isv.src.annotation_cache import AnnotationCache
+from isv.src.incremental_cache import IncrementalCollectionsParser
+from isv.src.instrumentation import METRICS, add_logging_arguments, configure_logging_from_args, log_duration
+from isv.src.model_registry import MODEL_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+def parse_region(item: Any) -> cnv_region.CNVRegion:
+    """Region given as "chr1:10000-20000/del" or as an object with chr, start, end and cnv_type."""
+    if isinstance(item, str):
+        return cnv_region.build_from_str(item)
+    return cnv_region.build_from_fields(str(item["chr"]), int(item["start"]), int(item["end"]), str(item["cnv_type"]))
+
+
+class ISVService:
+    """Annotation and prediction for the lifetime of the server, sharing one collections parser and the loaded models."""
+
+    def __init__(
+        self,
+        collection_parser: genovisio_sources_db.CollectionsParser,
+        annotate_func: Callable[..., CNVAnnotation] = annotate,
+        jobs: int = 1,
+        shap_mode: ShapMode = ShapMode.FULL,
+        annotation_cache: AnnotationCache | None = None,
+    ):
+        self.collection_parser = collection_parser
+        self.annotation_cache = annotation_cache
+        self.annotate_func = annotation_cache.wrap(annotate_func) if annotation_cache else annotate_func
+        self.jobs = jobs
+        self.shap_mode = shap_mode
+
+    def annotate(self, items: list[Any]) -> list[CNVAnnotation]:
+        regions = [parse_region(item) for item in items]
+        return list(
+            parallel.annotate_many(
+                regions,
+                lambda: self.collection_parser,
+                annotate_func=self.annotate_func,
+                jobs=min(self.jobs, len(regions)),
+                backend=parallel.ParallelBackend.THREAD,
+            )
+        )
+
+    def predict(self, items: list[Any]) -> list[dict[str, Any]]:
+        annotations = [CNVAnnotation.from_dict(item) for item in items]
+        return [prediction.to_dict() for prediction in predict_many(annotations, self.shap_mode)]
+
+    def run(self, items: list[Any]) -> list[dict[str, Any]]:
+        annotations = self.annotate(items)
+        return [
+            {"annotation": annotation.to_dict(), "prediction": prediction.to_dict()}
+            for annotation, prediction in zip(annotations, predict_many(annotations, self.shap_mode))
+        ]
+
+    def health(self) -> dict[str, Any]:
+        explain = self.shap_mode == ShapMode.FULL
+        models = {cnvtype.value: MODEL_REGISTRY.is_loaded(cnvtype, explain) for cnvtype in cnv_region.CNVType}
+        if isinstance(self.collection_parser, genovisio_sources_db.IntersectionCollectionsParser):
+            database = self.collection_parser.ping()
+        else:
+            database = True  # offline index, loaded at startup
+        health = {"ready": all(models.values()) and database, "models": models, "database": database}
+        if self.annotation_cache is not None:
+            health["annotation_cache"] = self.annotation_cache.describe()
+        if isinstance(self.collection_parser, IncrementalCollectionsParser):
+            health["incremental_cache"] = self.collection_parser.describe()
+        return health
+
+
+class ISVServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], service: ISVService):
+        super().__init__(address, ISVRequestHandler)
+        self.service = service
+
+
+class ISVRequestHandler(BaseHTTPRequestHandler):
+    """JSON API. POST bodies hold a single item, or a list of items to process as one batch."""
+
+    server: ISVServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # access log lines go through logging, so that --log_level and --log_format apply to them
+        logger.info(format, *args, extra={"fields": {"client": self.address_string()}})
+
+    def _send_json(self, status: HTTPStatus, body: Any) -> None:
+        data = serialization.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            data = METRICS.to_prometheus().encode()
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if self.path != "/health":
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {self.path}"})
+            return
+        health = self.server.service.health()
+        self._send_json(HTTPStatus.OK if health["ready"] else HTTPStatus.SERVICE_UNAVAILABLE, health)
+
+    def do_POST(self) -> None:
+        service = self.server.service
+        endpoints: dict[str, Callable[[list[Any]], list[Any]]] = {
+            "/annotate": lambda items: [annotation.to_dict() for annotation in service.annotate(items)],
+            "/predict": service.predict,
+            "/run": service.run,
+        }
+        if self.path not in endpoints:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {self.path}"})
+            return
+
+        try:
+            body = serialization.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            items = body if isinstance(body, list) else [body]
+            with log_duration(logger, "request", labels={"endpoint": self.path}, items=len(items)):
+                results = endpoints[self.path](items)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": f"Invalid request: {e!r}"})
+            return
+        except Exception as e:
+            logger.exception("Request to %s failed", self.path)
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": repr(e)})
+            return
+
+        with log_duration(logger, "serialize", labels={"endpoint": self.path}):
+            self._send_json(HTTPStatus.OK, results if isinstance(body, list) else results[0])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve ISV annotation and prediction over HTTP, keeping models warm.")
+    parser.add_argument("--host", help="Address to listen on", default="127.0.0.1")
+    parser.add_argument("--port", help="Port to listen on", type=int, default=8000)
+    cli_args.add_database_arguments(parser)
+    cli_args.add_cache_arguments(parser)
+    parser.add_argument(
+        "--jobs", help="Number of threads annotating the CNVs of one batch request", type=int, default=4
+    )
+    add_models_arguments(parser)
+    add_shap_argument(parser)
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    configure_logging_from_args(args)
+
+    configure_models_from_args(args)
+    METRICS.enabled = True
+    MODEL_REGISTRY.warm(explain=args.shap == ShapMode.FULL)
+
+    collection_parser = cli_args.build_collections_parser(parser, args)
+    service = ISVService(
+        collection_parser,
+        annotate_func=annotate_pushdown if args.pushdown else annotate,
+        jobs=args.jobs,
+        shap_mode=args.shap,
+        annotation_cache=cli_args.build_annotation_cache(args, collection_parser),
+    )
+    with ISVServer((args.host, args.port), service) as server:
+        logger.info("serving", extra={"fields": {"url": f"http://{args.host}:{args.port}/"}})
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
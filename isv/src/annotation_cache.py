@@ -0,0 +1,170 @@
+import collections
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Protocol, Sequence
+
+from isv.annotate import CNVAnnotation
+from isv.src import serialization
+from isv.src.cnv_region import CNVRegion
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+    def count(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class AnnotationStore(Protocol):
+    """One tier of the annotation cache."""
+
+    name: str
+    stats: CacheStats
+
+    def get(self, key: str) -> CNVAnnotation | None: ...
+
+    def put(self, key: str, annotation: CNVAnnotation) -> None: ...
+
+    def describe(self) -> dict[str, Any]: ...
+
+
+class LRUStore:
+    """In-memory tier, keeping the max_size most recently used annotations. Thread-safe."""
+
+    name = "memory"
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.stats = CacheStats()
+        self._annotations: collections.OrderedDict[str, CNVAnnotation] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CNVAnnotation | None:
+        with self._lock:
+            annotation = self._annotations.get(key)
+            if annotation is not None:
+                self._annotations.move_to_end(key)
+            self.stats.count(annotation is not None)
+            return annotation
+
+    def put(self, key: str, annotation: CNVAnnotation) -> None:
+        with self._lock:
+            self._annotations[key] = annotation
+            self._annotations.move_to_end(key)
+            while len(self._annotations) > self.max_size:
+                self._annotations.popitem(last=False)
+
+    def describe(self) -> dict[str, Any]:
+        return {"size": len(self._annotations), "max_size": self.max_size}
+
+
+class SQLiteStore:
+    """On-disk tier, storing the annotations as JSON in a SQLite database, shared by runs and processes."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS annotations (key TEXT PRIMARY KEY, annotation TEXT)")
+
+    def get(self, key: str) -> CNVAnnotation | None:
+        with self._lock:
+            row = self._connection.execute("SELECT annotation FROM annotations WHERE key = ?", (key,)).fetchone()
+            self.stats.count(row is not None)
+        return CNVAnnotation.from_dict(serialization.loads(row[0])) if row is not None else None
+
+    def put(self, key: str, annotation: CNVAnnotation) -> None:
+        data = serialization.dumps(annotation.to_dict())
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO annotations VALUES (?, ?)", (key, data))
+
+    def describe(self) -> dict[str, Any]:
+        with self._lock:
+            (size,) = self._connection.execute("SELECT COUNT(*) FROM annotations").fetchone()
+        return {"size": size, "path": self.path}
+
+
+class AnnotationCache:
+    """Annotations keyed by the region name and the source fingerprint, looked up in the stores fastest first.
+
+    A hit in a slower store is copied to the faster ones. Entries of other source data are never returned.
+    """
+
+    def __init__(self, stores: Sequence[AnnotationStore], source_fingerprint: str):
+        self.stores = list(stores)
+        self.source_fingerprint = source_fingerprint
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def get_key(self, region: CNVRegion) -> str:
+        return f"{self.source_fingerprint}/{region.name}"
+
+    def get(self, region: CNVRegion) -> CNVAnnotation | None:
+        key = self.get_key(region)
+        annotation = None
+        for i, store in enumerate(self.stores):
+            annotation = store.get(key)
+            if annotation is not None:
+                for faster_store in self.stores[:i]:
+                    faster_store.put(key, annotation)
+                break
+        with self._lock:
+            self.stats.count(annotation is not None)
+        return annotation
+
+    def put(self, region: CNVRegion, annotation: CNVAnnotation) -> None:
+        key = self.get_key(region)
+        for store in self.stores:
+            store.put(key, annotation)
+
+    def wrap(self, annotate_func: Callable[..., CNVAnnotation]) -> Callable[..., CNVAnnotation]:
+        """Annotate function with the signature of annotate(), answering from the cache where possible."""
+
+        def annotate_cached(*, region: CNVRegion, **kwargs: Any) -> CNVAnnotation:
+            annotation = self.get(region)
+            if annotation is None:
+                annotation = annotate_func(region=region, **kwargs)
+                self.put(region, annotation)
+            return annotation
+
+        return annotate_cached
+
+    def describe(self) -> dict[str, Any]:
+        """Hit and miss counts, overall and per store, to help sizing the cache."""
+        return {
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "hit_rate": self.stats.hit_rate,
+            "stores": {
+                store.name: {"hits": store.stats.hits, "misses": store.stats.misses, **store.describe()}
+                for store in self.stores
+            },
+        }
+
+
+def build_annotation_cache(
+    source_fingerprint: str, max_size: int = 0, sqlite_path: str | None = None
+) -> AnnotationCache | None:
+    """Cache with an in-memory tier of max_size annotations and/or a SQLite tier, or None if neither is enabled."""
+    stores: list[AnnotationStore] = []
+    if max_size > 0:
+        stores.append(LRUStore(max_size))
+    if sqlite_path:
+        stores.append(SQLiteStore(sqlite_path))
+    return AnnotationCache(stores, source_fingerprint) if stores else None
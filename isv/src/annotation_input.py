@@ -0,0 +1,81 @@
+"""Stored annotations of many CNVs, read one by one for bulk re-prediction.
+
+Each source keeps its offset: the position after the last annotation it yielded, from which a new source resumes.
+The checksum of the input (names, sizes and modification times of its files) tells whether the offset still applies.
+"""
+
+import hashlib
+import os
+from typing import Any, Iterator, Protocol
+
+from isv.annotate import CNVAnnotation
+from isv.src import serialization
+
+
+class AnnotationSource(Protocol):
+    path: str
+    offset: int
+
+    @property
+    def checksum(self) -> str: ...
+
+    def __iter__(self) -> Iterator[CNVAnnotation]: ...
+
+
+def get_files_checksum(paths: list[str]) -> str:
+    """Checksum of the names, sizes and modification times of the files, changing whenever a file is rewritten."""
+    checksum = hashlib.md5()
+    for path in paths:
+        stat = os.stat(path)
+        checksum.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return checksum.hexdigest()
+
+
+def parse_annotation(data: dict[str, Any]) -> CNVAnnotation:
+    """Annotation stored by isv-annotate, or the "annotation" of an isv-run JSONL record."""
+    return CNVAnnotation.from_dict(data.get("annotation", data))
+
+
+class JSONLAnnotations:
+    """Annotations of a JSONL file, one per line. The offset is in bytes, blank lines are skipped."""
+
+    def __init__(self, path: str, offset: int = 0):
+        self.path = path
+        self.offset = offset
+
+    @property
+    def checksum(self) -> str:
+        return get_files_checksum([self.path])
+
+    def __iter__(self) -> Iterator[CNVAnnotation]:
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                annotation = parse_annotation(serialization.loads(line)) if line.strip() else None
+                self.offset += len(line)
+                if annotation is not None:
+                    yield annotation
+
+
+class DirectoryAnnotations:
+    """Annotations of the .json files of a directory (as stored by isv-annotate --output), in order of their names.
+
+    The offset is the number of files read. The directory is listed once, files added later are not read.
+    """
+
+    def __init__(self, path: str, offset: int = 0):
+        self.path = path
+        self.offset = offset
+        self.files = sorted(
+            entry.name for entry in os.scandir(path) if entry.is_file() and entry.name.endswith(".json")
+        )
+
+    @property
+    def checksum(self) -> str:
+        return get_files_checksum([os.path.join(self.path, name) for name in self.files])
+
+    def __iter__(self) -> Iterator[CNVAnnotation]:
+        for name in self.files[self.offset :]:
+            annotation = CNVAnnotation.from_json(os.path.join(self.path, name))
+            self.offset += 1
+            yield annotation
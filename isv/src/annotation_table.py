@@ -0,0 +1,170 @@
+"""Columnar storage of many CNV annotations, for cohorts too large to keep as CNVAnnotation objects.
+
+The region and the ISVAnnotValues of each CNV are one record of a structured NumPy array (about a hundred bytes).
+Each gene list is stored as offsets into one array of codes of a gene name dictionary shared by all lists, as gene
+names recur across CNVs. The counts of AnnotationsReporting are derived from the values and the lists.
+"""
+
+import dataclasses
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from isv.annotate import AnnotationsReporting, CNVAnnotation, ISVAnnotValues
+from isv.src.cnv_region import CNVRegion, CNVType
+
+CNV_TYPES: list[CNVType] = list(CNVType)
+VALUE_FIELDS = [field.name for field in dataclasses.fields(ISVAnnotValues)]
+GENE_LIST_FIELDS = ["HI_genes", "TS_genes", "morbid_genes", "disease_associated_genes"]
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("chromosome", np.int16),
+        ("start", np.int64),
+        ("end", np.int64),
+        ("cnv_type", np.int8),
+        *[(name, np.int32) for name in VALUE_FIELDS],
+    ]
+)
+
+
+class GrowableArray:
+    """NumPy array appended to in amortized O(1), doubling its capacity when full."""
+
+    def __init__(self, dtype: np.dtype | type, capacity: int = 1024):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def _reserve(self, size: int) -> None:
+        if size > len(self._data):
+            data = np.zeros(max(size, 2 * len(self._data)), dtype=self._data.dtype)
+            data[: self.size] = self._data[: self.size]
+            self._data = data
+
+    def append(self, value: object) -> None:
+        self._reserve(self.size + 1)
+        self._data[self.size] = value
+        self.size += 1
+
+    def extend(self, values: np.ndarray | list[int]) -> None:
+        self._reserve(self.size + len(values))
+        self._data[self.size : self.size + len(values)] = values
+        self.size += len(values)
+
+    @property
+    def array(self) -> np.ndarray:
+        """View of the appended values."""
+        return self._data[: self.size]
+
+
+class AnnotationTable:
+    """Annotations of many CNVs in columns, indexed and iterated as CNVAnnotation rows. Not thread-safe."""
+
+    def __init__(self) -> None:
+        self._records = GrowableArray(RECORD_DTYPE)
+        self._gene_codes = {name: GrowableArray(np.int32) for name in GENE_LIST_FIELDS}
+        self._gene_offsets = {name: GrowableArray(np.int64) for name in GENE_LIST_FIELDS}
+        for offsets in self._gene_offsets.values():
+            offsets.append(0)
+        self.chromosomes: list[str] = []
+        self._chromosome_codes: dict[str, int] = {}
+        self.gene_names: list[str] = []
+        self._gene_name_codes: dict[str, int] = {}
+
+    @classmethod
+    def from_annotations(cls, annotations: Iterable[CNVAnnotation]) -> "AnnotationTable":
+        table = cls()
+        table.extend(annotations)
+        return table
+
+    def _encode(self, value: str, codes: dict[str, int], dictionary: list[str]) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(dictionary)
+            dictionary.append(value)
+        return code
+
+    def append(self, annotation: CNVAnnotation) -> None:
+        cnv = annotation.cnv
+        record = np.zeros((), dtype=RECORD_DTYPE)
+        record["chromosome"] = self._encode(cnv.chr, self._chromosome_codes, self.chromosomes)
+        record["start"] = cnv.start
+        record["end"] = cnv.end
+        record["cnv_type"] = CNV_TYPES.index(cnv.cnv_type)
+        for name in VALUE_FIELDS:
+            record[name] = getattr(annotation.isv_annot_values, name)
+        self._records.append(record)
+
+        for name in GENE_LIST_FIELDS:
+            genes = getattr(annotation.annotations_reporting, name)
+            self._gene_codes[name].extend(
+                [self._encode(gene, self._gene_name_codes, self.gene_names) for gene in genes]
+            )
+            self._gene_offsets[name].append(self._gene_codes[name].size)
+
+    def extend(self, annotations: Iterable[CNVAnnotation]) -> None:
+        for annotation in annotations:
+            self.append(annotation)
+
+    def __len__(self) -> int:
+        return self._records.size
+
+    @property
+    def records(self) -> np.ndarray:
+        """Structured array of the regions (chromosome and CNV type as codes) and the ISVAnnotValues."""
+        return self._records.array
+
+    @property
+    def cnv_types(self) -> np.ndarray:
+        """CNV type of each row, as an index into CNV_TYPES."""
+        return self.records["cnv_type"]
+
+    def matrix(self, attributes: list[str], rows: np.ndarray | None = None) -> np.ndarray:
+        """The attributes of the rows (all if None) as a float32 matrix, one column per attribute."""
+        records = self.records if rows is None else self.records[rows]
+        matrix = np.empty((len(records), len(attributes)), dtype=np.float32)
+        for column, attribute in enumerate(attributes):
+            matrix[:, column] = records[attribute]
+        return matrix
+
+    def gene_list(self, name: str, row: int) -> list[str]:
+        offsets = self._gene_offsets[name].array
+        codes = self._gene_codes[name].array[offsets[row] : offsets[row + 1]]
+        return [self.gene_names[code] for code in codes.tolist()]
+
+    def __getitem__(self, row: int) -> CNVAnnotation:
+        """The annotation of the row, rebuilt from the columns."""
+        if not -len(self) <= row < len(self):
+            raise IndexError(f"Row {row} out of range of a table with {len(self)} rows")
+        row %= len(self)
+        record = self.records[row]
+        values = ISVAnnotValues(**{name: int(record[name]) for name in VALUE_FIELDS})
+        genes = {name: self.gene_list(name, row) for name in GENE_LIST_FIELDS}
+        return CNVAnnotation(
+            cnv=CNVRegion(
+                chr=self.chromosomes[record["chromosome"]],
+                start=int(record["start"]),
+                end=int(record["end"]),
+                cnv_type=CNV_TYPES[record["cnv_type"]],
+            ),
+            isv_annot_values=values,
+            annotations_reporting=AnnotationsReporting(
+                **genes,
+                protein_coding_genes_count=values.protein_coding,
+                HI_genes_count=len(genes["HI_genes"]),
+                TS_genes_count=len(genes["TS_genes"]),
+                morbid_genes_count=len(genes["morbid_genes"]),
+                disease_associated_genes_count=len(genes["disease_associated_genes"]),
+            ),
+        )
+
+    def __iter__(self) -> Iterator[CNVAnnotation]:
+        for row in range(len(self)):
+            yield self[row]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the appended rows, excluding the spare capacity and the dictionaries."""
+        return self.records.nbytes + sum(
+            self._gene_codes[name].array.nbytes + self._gene_offsets[name].array.nbytes for name in GENE_LIST_FIELDS
+        )
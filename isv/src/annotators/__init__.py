@@ -1,21 +1,39 @@
-from .annotated_sv import GenesDBAnnotatedSV, count_annotated_sv
-from .gene_types import GenesDBGeneTypesCounter, count_gene_types
-from .hi_regions import HIRegionsCounter, count_hi_regions
-from .hi_ts_genes import HIandTSGenes, count_hi_genes
-from .regulatory import RegulatoryTypesCounter, count_regulatory_types
-from .ts_regions import TSRegionsCounter, count_ts_regions
+from .annotated_sv import AnnotatedSVCollector, GenesDBAnnotatedSV, count_annotated_sv
+from .gene_types import GenesDBGeneTypesCounter, count_gene_types, gene_types_from_counts
+from .hi_regions import HIRegionsCounter, count_hi_regions, hi_regions_from_counts
+from .hi_ts_genes import (
+    HI_GENE_SCORES,
+    TS_GENE_SCORES,
+    HIandTSGenes,
+    HIandTSGenesCollector,
+    count_hi_genes,
+    hi_genes_from_counts,
+)
+from .pipeline import AnnotationPipeline
+from .regulatory import RegulatoryTypesCounter, count_regulatory_types, regulatory_types_from_counts
+from .ts_regions import TSRegionsCounter, count_ts_regions, ts_regions_from_counts
 
 __all__ = [
+    "AnnotationPipeline",
+    "AnnotatedSVCollector",
     "GenesDBAnnotatedSV",
     "count_annotated_sv",
     "GenesDBGeneTypesCounter",
     "count_gene_types",
+    "gene_types_from_counts",
     "HIandTSGenes",
+    "HIandTSGenesCollector",
     "count_hi_genes",
+    "hi_genes_from_counts",
+    "HI_GENE_SCORES",
+    "TS_GENE_SCORES",
     "HIRegionsCounter",
     "count_hi_regions",
+    "hi_regions_from_counts",
     "RegulatoryTypesCounter",
     "count_regulatory_types",
+    "regulatory_types_from_counts",
     "TSRegionsCounter",
     "count_ts_regions",
+    "ts_regions_from_counts",
 ]
@@ -1,10 +1,12 @@
 import enum
-import sys
+import logging
 from dataclasses import dataclass
 from typing import Any
 
 from isv.src.dict_utils import count_or_append_types
 
+logger = logging.getLogger(__name__)
+
 
 class GenesDBAnnotatedTypes(enum.StrEnum):
     """Annotated types in the GenesDB database."""
@@ -37,27 +39,41 @@ class GenesDBAnnotatedSV:
         }
 
 
-def count_annotated_sv(annot_sv_data: list[dict[str, Any]], element_type: str) -> GenesDBAnnotatedSV:
-    morbid_genes_dict: dict[str, int] = {}
-    omim_phenotypes_dict: dict[str, int] = {}
-    morbid_genes_list: list[str] = []
-    omim_phenotypes_list: list[str] = []
+class AnnotatedSVCollector:
+    """Counts the morbid and disease associated genes document by document."""
 
-    print(f"{annot_sv_data=}", file=sys.stderr)
-    for doc in annot_sv_data:
-        if GenesDBAnnotatedTypes.OMIM_MORBID_GENE in doc[element_type].keys():
-            morbid_genes_dict = count_or_append_types(
-                doc[element_type][GenesDBAnnotatedTypes.OMIM_MORBID_GENE], morbid_genes_dict
+    def __init__(self, element_type: str):
+        self.element_type = element_type
+        self.morbid_genes_dict: dict[str, int] = {}
+        self.omim_phenotypes_dict: dict[str, int] = {}
+        self.morbid_genes_list: list[str] = []
+        self.omim_phenotypes_list: list[str] = []
+
+    def consume(self, doc: dict[str, Any]) -> None:
+        if GenesDBAnnotatedTypes.OMIM_MORBID_GENE in doc[self.element_type].keys():
+            self.morbid_genes_dict = count_or_append_types(
+                doc[self.element_type][GenesDBAnnotatedTypes.OMIM_MORBID_GENE], self.morbid_genes_dict
+            )
+            self.morbid_genes_list.append(doc[GenesDBAnnotatedTypes.GENE_NAME])
+
+        if GenesDBAnnotatedTypes.OMIM_PHENOTYPE in doc[self.element_type].keys():
+            self.omim_phenotypes_dict = count_or_append_types(
+                GenesDBAnnotatedTypes.ASSOCIATED, self.omim_phenotypes_dict
             )
-            morbid_genes_list.append(doc[GenesDBAnnotatedTypes.GENE_NAME])
-
-        if GenesDBAnnotatedTypes.OMIM_PHENOTYPE in doc[element_type].keys():
-            omim_phenotypes_dict = count_or_append_types(GenesDBAnnotatedTypes.ASSOCIATED, omim_phenotypes_dict)
-            omim_phenotypes_list.append(doc[GenesDBAnnotatedTypes.GENE_NAME])
-
-    return GenesDBAnnotatedSV(
-        morbid_genes=morbid_genes_dict.get("yes", 0),
-        disease_associated_genes=omim_phenotypes_dict.get(GenesDBAnnotatedTypes.ASSOCIATED, 0),
-        morbid_genes_list=morbid_genes_list,
-        disease_associated_genes_list=omim_phenotypes_list,
-    )
+            self.omim_phenotypes_list.append(doc[GenesDBAnnotatedTypes.GENE_NAME])
+
+    def result(self) -> GenesDBAnnotatedSV:
+        return GenesDBAnnotatedSV(
+            morbid_genes=self.morbid_genes_dict.get("yes", 0),
+            disease_associated_genes=self.omim_phenotypes_dict.get(GenesDBAnnotatedTypes.ASSOCIATED, 0),
+            morbid_genes_list=self.morbid_genes_list,
+            disease_associated_genes_list=self.omim_phenotypes_list,
+        )
+
+
+def count_annotated_sv(annot_sv_data: list[dict[str, Any]], element_type: str) -> GenesDBAnnotatedSV:
+    logger.debug("annot_sv_data=%s", annot_sv_data)
+    collector = AnnotatedSVCollector(element_type)
+    for doc in annot_sv_data:
+        collector.consume(doc)
+    return collector.result()
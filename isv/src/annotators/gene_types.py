@@ -1,10 +1,12 @@
 import enum
-import sys
+import logging
 from dataclasses import dataclass
 from typing import Any
 
 from isv.src.dict_utils import iterate_sv_info
 
+logger = logging.getLogger(__name__)
+
 
 class GenesDBGeneTypes(enum.StrEnum):
     """Types of genes as stored in the GenesDB database."""
@@ -32,7 +34,11 @@ class GenesDBGeneTypesCounter:
 
 def count_gene_types(genes_data: list[dict[str, Any]], element_type: str) -> GenesDBGeneTypesCounter:
     cnv_types_dict = iterate_sv_info(genes_data, element_type)
-    print(f"{cnv_types_dict=}", file=sys.stderr)
+    return gene_types_from_counts(cnv_types_dict)
+
+
+def gene_types_from_counts(cnv_types_dict: dict[str, int]) -> GenesDBGeneTypesCounter:
+    logger.debug("cnv_types_dict=%s", cnv_types_dict)
 
     counter = GenesDBGeneTypesCounter()
     if GenesDBGeneTypes.PROTEIN_CODING in cnv_types_dict:
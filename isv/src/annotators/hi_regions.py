@@ -1,9 +1,11 @@
-import sys
+import logging
 from dataclasses import dataclass
 from typing import Any
 
 from isv.src.dict_utils import iterate_sv_info
 
+logger = logging.getLogger(__name__)
+
 _INVALID_HI_REGIONS_VALUES = [40, 0, "", "nan"]
 
 
@@ -14,7 +16,11 @@ class HIRegionsCounter:
 
 def count_hi_regions(hi_regions_data: list[dict[str, Any]], element_type: str) -> HIRegionsCounter:
     cnv_types_dict_HI = iterate_sv_info(hi_regions_data, element_type)
-    print(f"{cnv_types_dict_HI=}", file=sys.stderr)
+    return hi_regions_from_counts(cnv_types_dict_HI)
+
+
+def hi_regions_from_counts(cnv_types_dict_HI: dict[Any, int]) -> HIRegionsCounter:
+    logger.debug("cnv_types_dict_HI=%s", cnv_types_dict_HI)
 
     cnv_types_dict_HI = {k: v for k, v in cnv_types_dict_HI.items() if k not in _INVALID_HI_REGIONS_VALUES}
     return HIRegionsCounter(regions_HI=sum(cnv_types_dict_HI.values()))
@@ -1,10 +1,14 @@
-import sys
+import logging
 from dataclasses import dataclass
 from typing import Any
 
 from isv.src.dict_utils import iterate_sv_info
 
+logger = logging.getLogger(__name__)
+
 _INVALID_HI_GENE_VALUES = [40, 0, "", "nan"]
+HI_GENE_SCORES = [1, 2, 3, 30]
+TS_GENE_SCORES = ["1", "2", "3", "30"]
 
 
 @dataclass
@@ -29,25 +33,38 @@ class HIandTSGenes:
 
 def count_hi_genes(hi_gene_data: list[dict[str, Any]], element_type: str) -> HIandTSGenes:
     cnv_types_dict_HI_genes = iterate_sv_info(hi_gene_data, element_type)
-    print(f"{cnv_types_dict_HI_genes=}", file=sys.stderr)
+    return hi_genes_from_counts(cnv_types_dict_HI_genes, hi_gene_data)
+
+
+class HIandTSGenesCollector:
+    """Collects the symbols of HI and TS genes document by document."""
+
+    def __init__(self) -> None:
+        self.hi_genes_list: list[str] = []
+        self.ts_genes_list: list[str] = []
+
+    def consume(self, hi_gene: dict[str, Any]) -> None:
+        if hi_gene["Haploinsufficiency Score"] in HI_GENE_SCORES:
+            self.hi_genes_list.append(hi_gene["Gene Symbol"])
 
-    cnv_types_dict_HI_genes = {k: v for k, v in cnv_types_dict_HI_genes.items() if k not in _INVALID_HI_GENE_VALUES}
+        if hi_gene["Triplosensitivity Score"] in TS_GENE_SCORES:
+            self.ts_genes_list.append(hi_gene["Gene Symbol"])
 
-    hi_genes_list: list[str] = []
-    ts_genes_list: list[str] = []
-    if len(hi_gene_data) > 0:
-        for i, hi_gene in enumerate(hi_gene_data):
-            hi_score = hi_gene_data[i]["Haploinsufficiency Score"]
-            ts_score = hi_gene_data[i]["Triplosensitivity Score"]
+    def result(self, cnv_types_dict_HI_genes: dict[Any, int]) -> HIandTSGenes:
+        """Builds HI and TS genes from HI score counts of all genes and the collected genes."""
+        logger.debug("cnv_types_dict_HI_genes=%s", cnv_types_dict_HI_genes)
 
-            if hi_score == 1 or hi_score == 2 or hi_score == 3 or hi_score == 30:
-                hi_genes_list.append(hi_gene_data[i]["Gene Symbol"])
+        cnv_types_dict_HI_genes = {k: v for k, v in cnv_types_dict_HI_genes.items() if k not in _INVALID_HI_GENE_VALUES}
+        return HIandTSGenes(
+            hi_genes=sum(cnv_types_dict_HI_genes.values()),
+            hi_genes_list=self.hi_genes_list,
+            ts_genes_list=self.ts_genes_list,
+        )
 
-            if ts_score == "1" or ts_score == "2" or ts_score == "3" or ts_score == "30":
-                ts_genes_list.append(hi_gene_data[i]["Gene Symbol"])
 
-    return HIandTSGenes(
-        hi_genes=sum(cnv_types_dict_HI_genes.values()),
-        hi_genes_list=hi_genes_list,
-        ts_genes_list=ts_genes_list,
-    )
+def hi_genes_from_counts(cnv_types_dict_HI_genes: dict[Any, int], hi_gene_data: list[dict[str, Any]]) -> HIandTSGenes:
+    """Builds HI and TS genes from HI score counts of all genes and the documents of the HI or TS genes."""
+    collector = HIandTSGenesCollector()
+    for hi_gene in hi_gene_data:
+        collector.consume(hi_gene)
+    return collector.result(cnv_types_dict_HI_genes)
@@ -0,0 +1,77 @@
+from typing import Any, Iterable
+
+from isv.src.dict_utils import DocumentConsumer, FanOut, FieldCounter
+from isv.src.instrumentation import TimedConsumer
+
+from .annotated_sv import AnnotatedSVCollector, GenesDBAnnotatedSV
+from .gene_types import GenesDBGeneTypesCounter, gene_types_from_counts
+from .hi_regions import HIRegionsCounter, hi_regions_from_counts
+from .hi_ts_genes import HIandTSGenes, HIandTSGenesCollector
+from .regulatory import RegulatoryTypesCounter, regulatory_types_from_counts
+from .ts_regions import TSRegionsCounter, ts_regions_from_counts
+
+
+class AnnotationPipeline:
+    """All annotators of a region, fed one document at a time.
+
+    Each collection has a single consumer passing its documents to every annotator interested in them, so a cursor is
+    read exactly once and only the counts and the reported gene symbols are kept, never the documents themselves.
+    If timed, the time spent in each annotator is added up, see annotator_seconds.
+    """
+
+    def __init__(self, timed: bool = False) -> None:
+        self.gene_types = FieldCounter("gene_type")
+        self.annotated_sv = AnnotatedSVCollector("AnnotSV")
+        self.hi_gene_scores = FieldCounter("Haploinsufficiency Score")
+        self.hi_ts_genes = HIandTSGenesCollector()
+        self.hi_region_scores = FieldCounter("Haploinsufficiency Score")
+        self.ts_region_scores = FieldCounter("Triplosensitivity Score")
+        self.regulatory_types = FieldCounter("type")
+        annotators: dict[str, dict[str, DocumentConsumer]] = {
+            "Genes": {"gene_types": self.gene_types, "annotated_sv": self.annotated_sv},
+            "HI_gene": {"hi_gene_scores": self.hi_gene_scores, "hi_ts_genes": self.hi_ts_genes},
+            "HI_region": {"hi_region_scores": self.hi_region_scores, "ts_region_scores": self.ts_region_scores},
+            "Regulatory": {"regulatory_types": self.regulatory_types},
+        }
+        self.timed_annotators: dict[str, TimedConsumer] = {}
+        if timed:
+            for collection_annotators in annotators.values():
+                for name, annotator in collection_annotators.items():
+                    collection_annotators[name] = self.timed_annotators[name] = TimedConsumer(annotator)
+
+        self.fan_outs = {
+            collection_name: FanOut(list(collection_annotators.values()))
+            for collection_name, collection_annotators in annotators.items()
+        }
+        self.consumers: dict[str, DocumentConsumer] = dict(self.fan_outs)
+
+    def consume(self, collection_name: str, documents: Iterable[dict[str, Any]]) -> None:
+        consumer = self.consumers[collection_name]
+        for doc in documents:
+            consumer.consume(doc)
+
+    def document_counts(self) -> dict[str, int]:
+        """Number of documents consumed per collection."""
+        return {collection_name: fan_out.documents for collection_name, fan_out in self.fan_outs.items()}
+
+    def annotator_seconds(self) -> dict[str, float]:
+        """Time spent in each annotator, empty if not timed."""
+        return {name: timed_annotator.seconds for name, timed_annotator in self.timed_annotators.items()}
+
+    def gene_type_counter(self) -> GenesDBGeneTypesCounter:
+        return gene_types_from_counts(self.gene_types.counts)
+
+    def annot_sv(self) -> GenesDBAnnotatedSV:
+        return self.annotated_sv.result()
+
+    def hi_and_ts_genes(self) -> HIandTSGenes:
+        return self.hi_ts_genes.result(self.hi_gene_scores.counts)
+
+    def hi_regions_counter(self) -> HIRegionsCounter:
+        return hi_regions_from_counts(self.hi_region_scores.counts)
+
+    def ts_regions_counter(self) -> TSRegionsCounter:
+        return ts_regions_from_counts(self.ts_region_scores.counts)
+
+    def regulatory_counter(self) -> RegulatoryTypesCounter:
+        return regulatory_types_from_counts(self.regulatory_types.counts)
@@ -58,6 +58,10 @@ class RegulatoryTypesCounter:
 
 def count_regulatory_types(regulatory_data: list[dict[str, Any]], element_type: str) -> RegulatoryTypesCounter:
     cnv_types_dict = iterate_sv_info(regulatory_data, "type")
+    return regulatory_types_from_counts(cnv_types_dict)
+
+
+def regulatory_types_from_counts(cnv_types_dict: dict[str, int]) -> RegulatoryTypesCounter:
     counter = RegulatoryTypesCounter(
         regulatory_enhancer=cnv_types_dict.get(RegulatoryTypes.ENAHNCER, 0),
         regulatory_promoter=cnv_types_dict.get(RegulatoryTypes.PROMOTER, 0),
@@ -1,9 +1,11 @@
-import sys
+import logging
 from dataclasses import dataclass
 from typing import Any
 
 from isv.src.dict_utils import iterate_sv_info
 
+logger = logging.getLogger(__name__)
+
 _INVALID_TS_REGIONS_VALUES = ["40", "0", "Not yet evaluated"]
 
 
@@ -14,7 +16,11 @@ class TSRegionsCounter:
 
 def count_ts_regions(ts_regions_data: list[dict[str, Any]], element_type: str) -> TSRegionsCounter:
     cnv_types_dict_TS = iterate_sv_info(ts_regions_data, element_type)
-    print(f"{cnv_types_dict_TS=}", file=sys.stderr)
+    return ts_regions_from_counts(cnv_types_dict_TS)
+
+
+def ts_regions_from_counts(cnv_types_dict_TS: dict[Any, int]) -> TSRegionsCounter:
+    logger.debug("cnv_types_dict_TS=%s", cnv_types_dict_TS)
 
     cnv_types_dict_TS = {k: v for k, v in cnv_types_dict_TS.items() if k not in _INVALID_TS_REGIONS_VALUES}
     return TSRegionsCounter(regions_TS=sum(cnv_types_dict_TS.values()))
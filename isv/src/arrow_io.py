@@ -0,0 +1,137 @@
+"""Annotations and predictions of many CNVs in one compressed Parquet or Arrow IPC file, written in row groups.
+
+Each row holds an "annotation" and a "prediction" struct column with the same layout as the JSONL records, so the SHAP
+values and scores are columns of nested structs (null if not computed). Requires pyarrow.
+"""
+
+import dataclasses
+import enum
+import os
+from typing import Any, Iterator
+
+from isv.annotate import AnnotationsReporting, CNVAnnotation, ISVAnnotValues
+from isv.predict import PREDICTION_THRESHOLD_SCHEMES, Prediction
+from isv.src import constants
+
+
+class ArrowFormat(enum.StrEnum):
+    PARQUET = "parquet"
+    ARROW = "arrow"
+
+
+FILE_EXTENSIONS = {".parquet": ArrowFormat.PARQUET, ".arrow": ArrowFormat.ARROW, ".feather": ArrowFormat.ARROW}
+
+
+def import_pyarrow() -> Any:
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet and Arrow files require pyarrow, install it using `pip install isv[arrow]`") from e
+    return pyarrow
+
+
+def guess_format(path: str) -> ArrowFormat | None:
+    """Format of the file by its extension, None if it is not a Parquet or Arrow file."""
+    return FILE_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def build_schema() -> Any:
+    pa = import_pyarrow()
+
+    def dataclass_struct(cls: type) -> Any:
+        return pa.struct(
+            [
+                (field.name, pa.list_(pa.string()) if field.type == list[str] else pa.int64())
+                for field in dataclasses.fields(cls)
+            ]
+        )
+
+    def attribute_struct() -> Any:
+        # gain and loss models share the attributes
+        return pa.struct([(attribute, pa.float64()) for attribute in constants.GAIN_ATTRIBUTES])
+
+    cnv = pa.struct(
+        [
+            ("chr", pa.string()),
+            ("start", pa.int64()),
+            ("end", pa.int64()),
+            ("cnv_type", pa.string()),
+            ("length", pa.int64()),
+        ]
+    )
+    annotation = pa.struct(
+        [
+            ("cnv", cnv),
+            ("isv_annot_values", dataclass_struct(ISVAnnotValues)),
+            ("annotations_reporting", dataclass_struct(AnnotationsReporting)),
+        ]
+    )
+    prediction = pa.struct(
+        [
+            ("isv_prediction", pa.float64()),
+            ("isv_score", pa.float64()),
+            ("isv_classification", pa.string()),
+            (
+                "isv_threshold_classifications",
+                pa.struct([(name, pa.string()) for name in PREDICTION_THRESHOLD_SCHEMES]),
+            ),
+            ("isv_shap_values", attribute_struct()),
+            ("isv_shap_scores", attribute_struct()),
+        ]
+    )
+    return pa.schema([("annotation", annotation), ("prediction", prediction)])
+
+
+class ArrowWriter:
+    """Writes the CNVs to a Parquet or Arrow IPC file, one row group (record batch) per row_group_size CNVs."""
+
+    def __init__(
+        self, path: str, file_format: ArrowFormat, row_group_size: int = 10_000, compression: str = "zstd"
+    ) -> None:
+        pa = import_pyarrow()
+        self.schema = build_schema()
+        self.row_group_size = row_group_size
+        self._rows: list[dict[str, Any]] = []
+        if file_format == ArrowFormat.PARQUET:
+            self._writer = pa.parquet.ParquetWriter(path, self.schema, compression=compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            self._writer = pa.ipc.new_file(path, self.schema, options=options)
+
+    def write(self, annotation: CNVAnnotation, prediction: Prediction) -> None:
+        prediction_data = prediction.to_dict()
+        for name in ["isv_shap_values", "isv_shap_scores"]:
+            # empty if not computed, stored as null instead of a struct of nulls
+            prediction_data[name] = prediction_data[name] or None
+        self._rows.append({"annotation": annotation.to_dict(), "prediction": prediction_data})
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._rows:
+            pa = import_pyarrow()
+            self._writer.write_batch(pa.RecordBatch.from_pylist(self._rows, schema=self.schema))
+            self._rows = []
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+
+
+def read_annotations(path: str, batch_size: int = 10_000) -> Iterator[CNVAnnotation]:
+    """Annotations of a file written by ArrowWriter (only its "annotation" column is read), batch by batch."""
+    pa = import_pyarrow()
+    if guess_format(path) == ArrowFormat.PARQUET:
+        batches = pa.parquet.ParquetFile(path).iter_batches(batch_size=batch_size, columns=["annotation"])
+        for batch in batches:
+            for data in batch.column("annotation").to_pylist():
+                yield CNVAnnotation.from_dict(data)
+        return
+
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            for data in reader.get_batch(i).column("annotation").to_pylist():
+                yield CNVAnnotation.from_dict(data)
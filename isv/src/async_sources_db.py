@@ -0,0 +1,75 @@
+"""Asyncio counterpart of genovisio_sources_db, using the optional Motor driver (`pip install isv[async]`)."""
+
+import asyncio
+import logging
+from typing import Any, Protocol
+
+from isv.src.cnv_region import CNVRegion
+from isv.src.genovisio_sources_db import build_intersection_query, build_projection
+from isv.src.instrumentation import log_duration
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 64
+
+
+class AsyncCollectionsParser(Protocol):
+    """Source of the documents intersecting a region, per collection name."""
+
+    async def get_for_region(self, region: CNVRegion) -> dict[str, list[dict[str, Any]]]: ...
+
+
+def get_motor_database(uri: str, db_name: str) -> Any:
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient
+    except ImportError as e:
+        raise ImportError("Asyncio annotation requires Motor, install it using `pip install isv[async]`") from e
+    return AsyncIOMotorClient(uri)[db_name]
+
+
+async def find_intersections(
+    collection: Any,
+    search_params: CNVRegion,
+    check_type: bool = False,
+    projection: list[str] | None = None,
+) -> list[dict[str, Any]]:
+    query = build_intersection_query(search_params, check_type)
+    return await collection.find(query, build_projection(projection)).to_list(None)
+
+
+class AsyncIntersectionCollectionsParser:
+    """Like IntersectionCollectionsParser, but queries all collections of a region at once without blocking.
+
+    At most max_concurrency queries are sent to MongoDB at a time, shared by all regions annotated concurrently.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        db_name: str,
+        collection_names: list[str],
+        check_type_names: list[str],
+        projections: dict[str, list[str]] | None = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
+        self.db = get_motor_database(uri, db_name)
+        self.collection_names = collection_names
+        self.check_type_names = check_type_names
+        self.projections = projections or {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _find(self, collection_name: str, region: CNVRegion) -> list[dict[str, Any]]:
+        async with self._semaphore:
+            with log_duration(logger, "query", labels={"collection": collection_name}) as fields:
+                documents = await find_intersections(
+                    self.db[collection_name],
+                    region,
+                    collection_name in self.check_type_names,
+                    self.projections.get(collection_name),
+                )
+                fields["documents"] = len(documents)
+            return documents
+
+    async def get_for_region(self, region: CNVRegion) -> dict[str, list[dict[str, Any]]]:
+        results = await asyncio.gather(*(self._find(name, region) for name in self.collection_names))
+        return dict(zip(self.collection_names, results))
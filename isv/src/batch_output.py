@@ -0,0 +1,90 @@
+import contextlib
+import enum
+import sys
+from typing import Any, ContextManager, Iterator, Protocol, TextIO
+
+from isv.annotate import CNVAnnotation
+from isv.predict import Prediction
+from isv.src import serialization
+
+
+class OutputFormat(enum.StrEnum):
+    JSONL = "jsonl"
+    TSV = "tsv"
+    PARQUET = "parquet"
+    ARROW = "arrow"
+
+
+# written by arrow_io.ArrowWriter to a file path, instead of a text stream
+COLUMNAR_FORMATS = [OutputFormat.PARQUET, OutputFormat.ARROW]
+
+
+class BatchWriter(Protocol):
+    def write(self, annotation: CNVAnnotation, prediction: Prediction) -> None: ...
+
+
+class JSONLWriter:
+    """Writes one compact JSON object per CNV, holding both the annotation and the prediction."""
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    def write(self, annotation: CNVAnnotation, prediction: Prediction) -> None:
+        record = {"annotation": annotation.to_dict(), "prediction": prediction.to_dict()}
+        self.stream.write(serialization.dumps(record) + "\n")
+
+
+class TSVWriter:
+    """Writes one row per CNV with the region, the annotation values and the prediction summary."""
+
+    def __init__(self, stream: TextIO, write_header: bool = True):
+        self.stream = stream
+        self._header_written = not write_header
+
+    def write(self, annotation: CNVAnnotation, prediction: Prediction) -> None:
+        row: dict[str, Any] = {
+            "cnv": annotation.cnv.name,
+            "chr": annotation.cnv.chr,
+            "start": annotation.cnv.start,
+            "end": annotation.cnv.end,
+            "cnv_type": annotation.cnv.cnv_type,
+            **annotation.isv_annot_values.as_dict_of_attributes(),
+            "isv_prediction": prediction.isv_prediction,
+            "isv_score": prediction.isv_score,
+            "isv_classification": prediction.isv_classification,
+        }
+        if not self._header_written:
+            self.stream.write("\t".join(row.keys()) + "\n")
+            self._header_written = True
+        self.stream.write("\t".join(str(value) for value in row.values()) + "\n")
+
+
+def get_writer(output_format: OutputFormat, stream: TextIO, write_header: bool = True) -> BatchWriter:
+    """Writer of a text format. write_header=False continues a TSV whose header has already been written."""
+    if output_format == OutputFormat.TSV:
+        return TSVWriter(stream, write_header)
+    return JSONLWriter(stream)
+
+
+@contextlib.contextmanager
+def open_writer(output_format: OutputFormat, path: str | None) -> Iterator[BatchWriter]:
+    """Writer of the format to the path (stdout if None, for the text formats), closing the file afterwards."""
+    if output_format in COLUMNAR_FORMATS:
+        if path is None:
+            raise ValueError(f"The {output_format} output format requires an output file")
+        from isv.src import arrow_io
+
+        writer = arrow_io.ArrowWriter(path, arrow_io.ArrowFormat(output_format))
+        try:
+            yield writer
+        finally:
+            writer.close()
+        return
+
+    stream: ContextManager[TextIO]
+    if path:
+        stream = open(path, "w")
+    else:
+        stream = contextlib.nullcontext(sys.stdout)
+    with stream as f:
+        yield get_writer(output_format, f)
@@ -0,0 +1,87 @@
+"""Checkpoints of a bulk re-prediction, so an interrupted run restarts after the last completed chunk.
+
+After each chunk the results are flushed and the checkpoint records the offset of the input source and the size of
+the output file. On resume the output is truncated to that size, dropping any results written after the checkpoint.
+"""
+
+import contextlib
+import dataclasses
+import os
+from dataclasses import dataclass
+from typing import Any
+
+from isv.predict import ShapMode
+from isv.src import batch_output, serialization
+from isv.src.annotation_input import AnnotationSource
+
+
+@dataclass
+class Checkpoint:
+    settings: dict[str, Any]  # input, output format, SHAP mode and models; resumed only by a run of the same
+    records: int = 0
+    input_offset: int = 0
+    output_bytes: int = 0
+
+    def save(self, path: str) -> None:
+        """Replace the checkpoint file atomically, so it is never left half written."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(serialization.dumps(dataclasses.asdict(self)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        with open(path, "rb") as f:
+            return cls(**serialization.loads(f.read()))
+
+
+def restore(path: str, settings: dict[str, Any], output: str) -> Checkpoint:
+    """Checkpoint stored at the path with the output truncated to its size, or a new one and an empty output."""
+    if not os.path.exists(path):
+        open(output, "w").close()
+        return Checkpoint(settings)
+
+    checkpoint = Checkpoint.load(path)
+    if checkpoint.settings != settings:
+        raise ValueError(
+            f"Checkpoint {path} was written with {checkpoint.settings}, not {settings}. "
+            "Remove it to start the run from the beginning."
+        )
+    if not os.path.exists(output) or os.path.getsize(output) < checkpoint.output_bytes:
+        raise ValueError(f"Output {output} is shorter than recorded in the checkpoint {path}")
+    os.truncate(output, checkpoint.output_bytes)
+    return checkpoint
+
+
+def run_resumable(
+    source: AnnotationSource,
+    output: str,
+    output_format: batch_output.OutputFormat,
+    checkpoint: Checkpoint,
+    path: str,
+    chunk_size: int = 256,
+    shap_mode: ShapMode = ShapMode.FULL,
+) -> int:
+    """Predict the source, appending the results in a text format to the output. Returns the CNVs predicted by this run.
+
+    The source starts at the offset of the checkpoint. The checkpoint is saved after each chunk and removed once the
+    source is exhausted.
+    """
+    from isv.main import run_batch
+
+    records = checkpoint.records
+    with open(output, "a") as stream:
+        writer = batch_output.get_writer(output_format, stream, write_header=checkpoint.output_bytes == 0)
+
+        def save(count: int) -> None:
+            stream.flush()
+            checkpoint.records = records + count
+            checkpoint.input_offset = source.offset
+            checkpoint.output_bytes = stream.tell()
+            checkpoint.save(path)
+
+        count = run_batch(source, writer, chunk_size, shap_mode, on_chunk=save)
+    # not written if the source was empty
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+    return count
@@ -0,0 +1,149 @@
+import argparse
+import functools
+from typing import Callable
+
+from isv.src import annotation_cache, async_sources_db, constants, genovisio_sources_db
+from isv.src.incremental_cache import IncrementalCollectionsParser
+from isv.src.interval_index import IntervalIndexCollectionsParser
+from isv.src.snapshot import SnapshotCollectionsParser
+
+
+def add_database_arguments(parser: argparse.ArgumentParser) -> None:
+    """Arguments selecting the source of the annotation documents, shared by isv-annotate and isv-run."""
+    parser.add_argument("--mongodb_uri", help="MongoDB full URI", default="mongodb://localhost:27017/")
+    parser.add_argument("--db_name", help="MongoDB database name", default="genovisio")
+    add_source_version_argument(parser)
+    parser.add_argument(
+        "--query_mode",
+        help="Query collections one by one, concurrently, or in one $unionWith aggregation (MongoDB 4.4+)",
+        choices=list(genovisio_sources_db.QueryMode),
+        default=genovisio_sources_db.QueryMode.CONCURRENT,
+    )
+    parser.add_argument("--pushdown", help="Count the documents in MongoDB aggregations", action="store_true")
+    parser.add_argument(
+        "--export_dir",
+        help="Annotate offline from <collection>.json files created by mongoexport, instead of querying MongoDB",
+        default=None,
+    )
+    parser.add_argument(
+        "--snapshot",
+        help="Annotate offline from a memory-mapped snapshot created by isv-build-index, instead of querying MongoDB",
+        default=None,
+    )
+
+
+def add_source_version_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--source_version",
+        help="Version of the MongoDB data (e.g. the date of its last import), identifying it for the annotation cache "
+        "and snapshots instead of a checksum of all documents",
+        default=None,
+    )
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--annotation_cache_size",
+        help="Number of annotations kept in memory, reused for repeated CNVs",
+        type=int,
+        default=0,
+    )
+    parser.add_argument("--annotation_cache_db", help="SQLite file caching the annotations across runs", default=None)
+    parser.add_argument(
+        "--incremental_cache_size",
+        help="Number of recent regions whose documents are kept, so that overlapping CNVs query only the difference",
+        type=int,
+        default=0,
+    )
+
+
+def is_cache_enabled(args: argparse.Namespace) -> bool:
+    return bool(args.annotation_cache_size or args.annotation_cache_db)
+
+
+def build_annotation_cache(
+    args: argparse.Namespace, collection_parser: genovisio_sources_db.CollectionsParser
+) -> annotation_cache.AnnotationCache | None:
+    """Annotation cache selected by the arguments, keyed by the fingerprint of the parser's source data."""
+    if not is_cache_enabled(args):
+        return None
+    return annotation_cache.build_annotation_cache(
+        collection_parser.source_fingerprint, args.annotation_cache_size, args.annotation_cache_db
+    )
+
+
+def make_collections_parser(
+    mongodb_uri: str,
+    db_name: str,
+    query_mode: genovisio_sources_db.QueryMode,
+    export_dir: str | None = None,
+    snapshot: str | None = None,
+    incremental_cache_size: int = 0,
+    source_version: str | None = None,
+) -> genovisio_sources_db.CollectionsParser:
+    collection_parser: genovisio_sources_db.CollectionsParser
+    if snapshot:
+        collection_parser = SnapshotCollectionsParser(snapshot, constants.CHECK_TYPE_NAMES)
+    elif export_dir:
+        collection_parser = IntervalIndexCollectionsParser.from_export_dir(
+            export_dir, constants.ANNOTATION_COLLECTION_NAMES, constants.CHECK_TYPE_NAMES
+        )
+    else:
+        collection_parser = genovisio_sources_db.IntersectionCollectionsParser(
+            uri=mongodb_uri,
+            db_name=db_name,
+            collection_names=constants.ANNOTATION_COLLECTION_NAMES,
+            check_type_names=constants.CHECK_TYPE_NAMES,
+            projections=constants.ANNOTATION_PROJECTIONS,
+            query_mode=query_mode,
+            source_version=source_version,
+        )
+
+    if incremental_cache_size > 0:
+        return IncrementalCollectionsParser(collection_parser, incremental_cache_size)
+    return collection_parser
+
+
+def collections_parser_factory(
+    parser: argparse.ArgumentParser, args: argparse.Namespace
+) -> Callable[[], genovisio_sources_db.CollectionsParser]:
+    """Picklable factory of the collections parser selected by the arguments, e.g. for worker processes."""
+    if args.pushdown and (args.export_dir or args.snapshot):
+        parser.error("--pushdown requires MongoDB and cannot be combined with --export_dir or --snapshot")
+    if args.pushdown and args.incremental_cache_size:
+        parser.error("--pushdown cannot be combined with --incremental_cache_size")
+
+    return functools.partial(
+        make_collections_parser,
+        mongodb_uri=args.mongodb_uri,
+        db_name=args.db_name,
+        query_mode=args.query_mode,
+        export_dir=args.export_dir,
+        snapshot=args.snapshot,
+        incremental_cache_size=args.incremental_cache_size,
+        source_version=args.source_version,
+    )
+
+
+def build_collections_parser(
+    parser: argparse.ArgumentParser, args: argparse.Namespace
+) -> genovisio_sources_db.CollectionsParser:
+    return collections_parser_factory(parser, args)()
+
+
+def async_collections_parser_factory(
+    parser: argparse.ArgumentParser, args: argparse.Namespace, max_concurrency: int
+) -> Callable[[], async_sources_db.AsyncCollectionsParser]:
+    """Factory of the asyncio collections parser, which queries MongoDB only."""
+    if args.pushdown or args.export_dir or args.snapshot or is_cache_enabled(args) or args.incremental_cache_size:
+        parser.error("The asyncio backend cannot be combined with --pushdown, --export_dir, --snapshot or caches")
+
+    return functools.partial(
+        async_sources_db.AsyncIntersectionCollectionsParser,
+        uri=args.mongodb_uri,
+        db_name=args.db_name,
+        collection_names=constants.ANNOTATION_COLLECTION_NAMES,
+        check_type_names=constants.CHECK_TYPE_NAMES,
+        projections=constants.ANNOTATION_PROJECTIONS,
+        max_concurrency=max_concurrency,
+    )
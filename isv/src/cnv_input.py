@@ -0,0 +1,114 @@
+import enum
+import gzip
+import os
+from typing import Iterator, TextIO
+
+from isv.src.cnv_region import CNVRegion, build_from_fields, build_from_str
+
+
+class InputFormat(enum.StrEnum):
+    BED = "bed"
+    VCF = "vcf"
+    TSV = "tsv"
+
+
+DIPLOID_COPY_NUMBER = 2
+
+
+def detect_format(path: str) -> InputFormat:
+    name = path.lower().removesuffix(".gz")
+    if name.endswith(".bed"):
+        return InputFormat.BED
+    if name.endswith(".vcf"):
+        return InputFormat.VCF
+    return InputFormat.TSV
+
+
+def _open_text(path: str) -> TextIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+def _normalize_chrom(chrom: str) -> str:
+    return chrom if chrom.startswith("chr") else f"chr{chrom}"
+
+
+def _parse_bed_line(fields: list[str]) -> CNVRegion:
+    """BED line with chrom, 0-based start, end and CNV type in the 4th column."""
+    return build_from_fields(_normalize_chrom(fields[0]), int(fields[1]) + 1, int(fields[2]), fields[3])
+
+
+def _is_header(fields: list[str]) -> bool:
+    """Column names of a BED or TSV file, e.g. "chrom start end type", rather than a CNV."""
+    if len(fields) == 1:
+        return ":" not in fields[0]
+    return not fields[1].strip().isdigit()
+
+
+def _vcf_cnv_type(fields: list[str], info: dict[str, str]) -> str:
+    """CNV type of a VCF record, its SVTYPE unless that is CNV or missing.
+
+    Then the first ALT allele if <DEL> or <DUP> (also with a subtype, e.g. <DUP:TANDEM>), else the copy number of a
+    <CNn> ALT allele or of CN in INFO or in the first sample, compared to the diploid copy number.
+    """
+    svtype = info.get("SVTYPE", "")
+    if svtype and svtype.upper() != "CNV":
+        return svtype
+
+    allele = fields[4].split(",")[0].strip("<>").split(":")[0].upper()
+    if allele in ("DEL", "DUP"):
+        return allele.lower()
+    copy_number = info.get("CN")
+    if allele.startswith("CN") and allele[2:].isdigit():
+        copy_number = allele[2:]
+    elif copy_number is None and len(fields) > 9:
+        copy_number = dict(zip(fields[8].split(":"), fields[9].split(":"))).get("CN")
+    if copy_number is None or copy_number == ".":
+        raise ValueError("no SVTYPE, <DEL>/<DUP> ALT allele or CN copy number")
+    if float(copy_number) == DIPLOID_COPY_NUMBER:
+        raise ValueError(f"copy number {copy_number} is not a CNV")
+    return "del" if float(copy_number) < DIPLOID_COPY_NUMBER else "dup"
+
+
+def _parse_vcf_line(fields: list[str]) -> CNVRegion:
+    """VCF record with END in INFO and the CNV type given by SVTYPE, the ALT allele or the copy number."""
+    info = dict(item.split("=", 1) for item in fields[7].split(";") if "=" in item)
+    return build_from_fields(_normalize_chrom(fields[0]), int(fields[1]), int(info["END"]), _vcf_cnv_type(fields, info))
+
+
+def _parse_tsv_line(fields: list[str]) -> CNVRegion:
+    """Either a single "chr1:10000-20000/del" column, or chrom, start, end and CNV type columns."""
+    if len(fields) < 4:
+        return build_from_str(fields[0])
+    return build_from_fields(_normalize_chrom(fields[0]), int(fields[1]), int(fields[2]), fields[3])
+
+
+_PARSERS = {
+    InputFormat.BED: _parse_bed_line,
+    InputFormat.VCF: _parse_vcf_line,
+    InputFormat.TSV: _parse_tsv_line,
+}
+
+
+def read_regions(path: str, input_format: InputFormat | None = None) -> Iterator[CNVRegion]:
+    """Lazily parse CNV regions from a BED, VCF or TSV file, skipping headers and comments.
+
+    Headers are the lines starting with #, track or browser, and a first BED or TSV line of column names.
+    """
+    input_format = input_format or detect_format(path)
+    parse_line = _PARSERS[input_format]
+    first = True
+    with _open_text(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if first and input_format != InputFormat.VCF and _is_header(fields):
+                first = False
+                continue
+            first = False
+            try:
+                yield parse_line(fields)
+            except (ValueError, IndexError, KeyError) as e:
+                raise ValueError(f"{os.path.basename(path)}:{line_number}: cannot parse CNV from {line!r}: {e}") from e
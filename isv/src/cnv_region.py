@@ -1,6 +1,7 @@
 import enum
 import re
 from dataclasses import dataclass, field
+from typing import Any
 
 from isv.src import cnv_region, constants
 
@@ -21,27 +22,39 @@ class CNVRegion:
     def __post_init__(self) -> None:
         self.length = self.end - self.start
 
+    def to_dict(self) -> dict[str, Any]:
+        return dict(vars(self))
+
     @property
     def name(self) -> str:
         return f"{self.chr}_{self.start}_{self.end}_{self.cnv_type}"
 
 
-def build_from_str(input_str: str) -> CNVRegion:
-    match = re.match(r"(chr[\dXY]+):(\d+)-(\d+)/(\w+)", input_str)
-    cnv_type_map = {"del": "loss", "dup": "gain", "gain": "gain", "loss": "loss", "aoh": "loss"}
-    if (
-        not match
-        or match.group(4).lower() not in cnv_type_map.keys()
-        or match.group(1) not in constants.ALLOWED_CHROMOSOMES
-    ):
-        raise ValueError(
-            f'Input format must be "chr1:10000-20000/del". CNV type should be {"/".join(cnv_type_map.keys())}. '
-            f'Chromosome should be {"/".join(constants.ALLOWED_CHROMOSOMES)}'
-        )
+CNV_TYPE_MAP = {"del": "loss", "dup": "gain", "gain": "gain", "loss": "loss", "aoh": "loss"}
+
+
+def _format_error() -> ValueError:
+    return ValueError(
+        f'Input format must be "chr1:10000-20000/del". CNV type should be {"/".join(CNV_TYPE_MAP.keys())}. '
+        f'Chromosome should be {"/".join(constants.ALLOWED_CHROMOSOMES)}'
+    )
+
+
+def build_from_fields(chrom: str, start: int, end: int, cnv_type: str) -> CNVRegion:
+    if cnv_type.lower() not in CNV_TYPE_MAP.keys() or chrom not in constants.ALLOWED_CHROMOSOMES:
+        raise _format_error()
 
     return cnv_region.CNVRegion(
-        chr=match.group(1),
-        start=int(match.group(2)),
-        end=int(match.group(3)),
-        cnv_type=cnv_region.CNVType(cnv_type_map[match.group(4).lower()]),
+        chr=chrom,
+        start=start,
+        end=end,
+        cnv_type=cnv_region.CNVType(CNV_TYPE_MAP[cnv_type.lower()]),
     )
+
+
+def build_from_str(input_str: str) -> CNVRegion:
+    match = re.match(r"(chr[\dXY]+):(\d+)-(\d+)/(\w+)", input_str)
+    if not match:
+        raise _format_error()
+
+    return build_from_fields(match.group(1), int(match.group(2)), int(match.group(3)), match.group(4))
@@ -0,0 +1,141 @@
+"""XGBoost models compiled into flat NumPy arrays, scored without xgboost, joblib or pandas.
+
+The nodes of all trees are concatenated: feature index, threshold, left and right child (global node indices) and the
+direction of missing values per node, with the value of the leaves. Leaves point to themselves, so all rows advance
+through all trees in lockstep for max_depth steps and end up in their leaves.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+FORMAT_VERSION = 1
+SUPPORTED_OBJECTIVES = ["binary:logistic"]
+
+
+@dataclass
+class CompiledModel:
+    feature_names: list[str]
+    roots: np.ndarray
+    features: np.ndarray
+    thresholds: np.ndarray
+    left_children: np.ndarray
+    right_children: np.ndarray
+    default_left: np.ndarray
+    leaf_values: np.ndarray
+    base_margin: float
+    max_depth: int
+
+    def predict_margin(self, matrix: np.ndarray) -> np.ndarray:
+        """Sum of the leaf values of each row (rows by features), plus the base margin."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        rows = np.arange(len(matrix))[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (len(matrix), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            values = matrix[rows, self.features[nodes]]
+            go_left = np.where(np.isnan(values), self.default_left[nodes], values < self.thresholds[nodes])
+            nodes = np.where(go_left, self.left_children[nodes], self.right_children[nodes])
+
+        # added tree by tree in float32, in the order XGBoost adds them
+        margin = np.full(len(matrix), self.base_margin, dtype=np.float32)
+        for leaf_values in self.leaf_values[nodes].T:
+            margin += leaf_values
+        return margin
+
+    def predict(self, matrix: np.ndarray) -> np.ndarray:
+        """Probabilities of the rows, as Booster.predict of the binary:logistic model."""
+        margin = self.predict_margin(matrix)
+        return (np.float32(1) / (np.float32(1) + np.exp(-margin))).astype(np.float32)
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                format_version=FORMAT_VERSION,
+                feature_names=np.array(self.feature_names),
+                roots=self.roots,
+                features=self.features,
+                thresholds=self.thresholds,
+                left_children=self.left_children,
+                right_children=self.right_children,
+                default_left=self.default_left,
+                leaf_values=self.leaf_values,
+                base_margin=self.base_margin,
+                max_depth=self.max_depth,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledModel":
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["format_version"]) != FORMAT_VERSION:
+                raise ValueError(f"Unsupported compiled model format version {int(data['format_version'])} of {path}")
+            return cls(
+                feature_names=data["feature_names"].tolist(),
+                roots=data["roots"],
+                features=data["features"],
+                thresholds=data["thresholds"],
+                left_children=data["left_children"],
+                right_children=data["right_children"],
+                default_left=data["default_left"],
+                leaf_values=data["leaf_values"],
+                base_margin=float(data["base_margin"]),
+                max_depth=int(data["max_depth"]),
+            )
+
+
+def get_depth(left_children: list[int], right_children: list[int], node: int = 0) -> int:
+    """Number of splits on the longest path from the node to a leaf."""
+    if left_children[node] == -1:
+        return 0
+    return 1 + max(
+        get_depth(left_children, right_children, left_children[node]),
+        get_depth(left_children, right_children, right_children[node]),
+    )
+
+
+def compile_booster(booster: Any) -> CompiledModel:
+    """Compile the trees of an xgboost.Booster (all boosted rounds, as scored by Booster.predict)."""
+    config = json.loads(booster.save_config())
+    objective = config["learner"]["objective"]["name"]
+    if objective not in SUPPORTED_OBJECTIVES:
+        raise ValueError(f"Cannot compile a model with objective {objective}, supported are {SUPPORTED_OBJECTIVES}")
+    base_score = float(config["learner"]["learner_model_param"]["base_score"])
+
+    model = json.loads(booster.save_raw("json"))["learner"]["gradient_booster"]["model"]
+    roots: list[int] = []
+    features: list[int] = []
+    thresholds: list[float] = []
+    left_children: list[int] = []
+    right_children: list[int] = []
+    default_left: list[bool] = []
+    leaf_values: list[float] = []
+    max_depth = 0
+    for tree in model["trees"]:
+        if any(split_type != 0 for split_type in tree["split_type"]):
+            raise ValueError("Cannot compile a model with categorical splits")
+        offset = len(features)
+        roots.append(offset)
+        max_depth = max(max_depth, get_depth(tree["left_children"], tree["right_children"]))
+        for node, (left, right) in enumerate(zip(tree["left_children"], tree["right_children"])):
+            is_leaf = left == -1
+            features.append(0 if is_leaf else tree["split_indices"][node])
+            thresholds.append(0.0 if is_leaf else tree["split_conditions"][node])
+            left_children.append(offset + node if is_leaf else offset + left)
+            right_children.append(offset + node if is_leaf else offset + right)
+            default_left.append(bool(tree["default_left"][node]))
+            leaf_values.append(tree["split_conditions"][node] if is_leaf else 0.0)
+
+    return CompiledModel(
+        feature_names=list(booster.feature_names),
+        roots=np.array(roots, dtype=np.int32),
+        features=np.array(features, dtype=np.int32),
+        thresholds=np.array(thresholds, dtype=np.float32),
+        left_children=np.array(left_children, dtype=np.int32),
+        right_children=np.array(right_children, dtype=np.int32),
+        default_left=np.array(default_left, dtype=bool),
+        leaf_values=np.array(leaf_values, dtype=np.float32),
+        base_margin=float(np.log(base_score / (1 - base_score))),
+        max_depth=max_depth,
+    )
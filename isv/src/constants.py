@@ -1,6 +1,15 @@
 COLLECTION_NAMES = ["Benign_CNV", "Regulatory", "GnomAD", "HI_gene", "HI_region", "Genes"]
 CHECK_TYPE_NAMES = ["Benign_CNV"]
 
+# Collections and fields actually read by the annotators, so only these are queried and fetched
+ANNOTATION_PROJECTIONS = {
+    "Genes": ["start", "end", "gene_type", "gene_name", "AnnotSV.omim_morbid_gene", "AnnotSV.omim_phenotype"],
+    "HI_gene": ["start", "end", "Gene Symbol", "Haploinsufficiency Score", "Triplosensitivity Score"],
+    "HI_region": ["start", "end", "Haploinsufficiency Score", "Triplosensitivity Score"],
+    "Regulatory": ["start", "end", "type"],
+}
+ANNOTATION_COLLECTION_NAMES = list(ANNOTATION_PROJECTIONS)
+
 LOSS_ATTRIBUTES = GAIN_ATTRIBUTES = [
     "gencode_genes",
     "protein_coding",
@@ -1,4 +1,10 @@
-from typing import Any
+from typing import Any, Protocol
+
+
+class DocumentConsumer(Protocol):
+    """Receives the documents of a collection one by one."""
+
+    def consume(self, doc: dict[str, Any]) -> None: ...
 
 
 def count_or_append_types(type_element: str, cnv_types_dict: dict[str, int]) -> dict[str, int]:
@@ -10,9 +16,33 @@ def count_or_append_types(type_element: str, cnv_types_dict: dict[str, int]) ->
     return cnv_types_dict
 
 
+class FieldCounter:
+    """Counts the documents per value of the element type, document by document."""
+
+    def __init__(self, element_type: str):
+        self.element_type = element_type
+        self.counts: dict[str, int] = {}
+
+    def consume(self, doc: dict[str, Any]) -> None:
+        if self.element_type in doc.keys():
+            self.counts = count_or_append_types(doc[self.element_type], self.counts)
+
+
+class FanOut:
+    """Feeds each document to all of the consumers, counting the documents."""
+
+    def __init__(self, consumers: list[DocumentConsumer]):
+        self.consumers = consumers
+        self.documents = 0
+
+    def consume(self, doc: dict[str, Any]) -> None:
+        self.documents += 1
+        for consumer in self.consumers:
+            consumer.consume(doc)
+
+
 def iterate_sv_info(info_sv: list[dict[str, Any]], element_type: str) -> dict[str, int]:
-    cnv_types_dict: dict[str, int] = {}
+    counter = FieldCounter(element_type)
     for doc in info_sv:
-        if element_type in doc.keys():
-            cnv_types_dict = count_or_append_types(doc[element_type], cnv_types_dict)
-    return cnv_types_dict
+        counter.consume(doc)
+    return counter.counts
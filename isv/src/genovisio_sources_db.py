@@ -1,10 +1,56 @@
-from typing import Any
+import enum
+import functools
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Protocol, TypeVar
 
+import bson
+import pymongo
 from pymongo import MongoClient
 from pymongo.collection import Collection
 from pymongo.database import Database
+from pymongo.errors import PyMongoError
 
 from isv.src.cnv_region import CNVRegion
+from isv.src.dict_utils import DocumentConsumer
+from isv.src.instrumentation import log_duration
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class QueryMode(enum.StrEnum):
+    """How the per-collection intersection queries of one region are issued."""
+
+    SEQUENTIAL = "sequential"
+    CONCURRENT = "concurrent"
+    UNION = "union"
+
+
+class CollectionsParser(Protocol):
+    """Source of the documents intersecting a region, per collection name."""
+
+    def get_for_region(self, region: CNVRegion) -> dict[str, list[dict[str, Any]]]: ...
+
+    def stream_for_region(self, region: CNVRegion, consumers: dict[str, DocumentConsumer]) -> None:
+        """Feed the documents intersecting the region to the consumer of their collection, one by one."""
+        ...
+
+    def scan_sorted(self, collection_name: str, region: CNVRegion) -> Iterator[dict[str, Any]]:
+        """Yield the documents of the collection intersecting the region in order of their start, of all CNV types."""
+        ...
+
+    @property
+    def check_type_names(self) -> list[str]:
+        """Collections whose documents intersect only regions of the same CNV type."""
+        ...
+
+    @property
+    def source_fingerprint(self) -> str:
+        """Checksum of the source data, see get_source_fingerprint."""
+        ...
 
 
 def get_mongo_database(uri: str, db_name: str) -> Database[dict[str, Any]]:
@@ -12,35 +58,265 @@ def get_mongo_database(uri: str, db_name: str) -> Database[dict[str, Any]]:
     return client[db_name]
 
 
-def find_intersections(
-    collection: Collection[dict[str, Any]], search_params: CNVRegion, check_type: bool = False
-) -> list[dict[str, Any]]:
-    query = {
+def get_source_fingerprint(
+    db: Database[dict[str, Any]],
+    collection_names: list[str],
+    projections: dict[str, list[str]] | None = None,
+    source_version: str | None = None,
+) -> str:
+    """Checksum of the collections' contents, changing whenever the source data changes.
+
+    Reads every document of the collections, which takes a while on the full database. A source_version named by the
+    user (e.g. the date of the last import) is used instead when given, without reading them.
+    """
+    if source_version:
+        return f"version:{source_version}"
+    try:
+        return db.command("dbHash", collections=collection_names)["md5"]
+    except (PyMongoError, NotImplementedError):
+        # dbHash is not available (e.g. on mongos), hash the documents as fetched
+        return hash_documents(db, collection_names, projections or {})
+
+
+def hash_documents(db: Database[dict[str, Any]], collection_names: list[str], projections: dict[str, list[str]]) -> str:
+    """Checksum of the projected fields of all documents, independent of the order in which they are returned."""
+    checksum = hashlib.md5()
+    for name in collection_names:
+        total = 0
+        with db[name].find({}, build_projection(projections.get(name))) as cursor:
+            for doc in cursor:
+                total += int.from_bytes(hashlib.md5(bson.encode(doc)).digest())
+        checksum.update(f"{name}:{total % 2**128:x};".encode())
+    return checksum.hexdigest()
+
+
+def build_intersection_query(search_params: CNVRegion, check_type: bool = False) -> dict[str, Any]:
+    query: dict[str, Any] = {
         "chromosome": search_params.chr,
         "start": {"$lte": search_params.end},  # search_params.start <= other.end
         "end": {"$gte": search_params.start},  # search_params.end >= other.start
     }
     if check_type:
         query["cnv_type"] = search_params.cnv_type
+    return query
+
+
+def build_projection(fields: list[str] | None) -> dict[str, int] | None:
+    if fields is None:
+        return None
+    return {field: 1 for field in fields}
+
 
-    with collection.find(query) as cursor:
-        results = list(cursor)
+def iter_intersections(
+    collection: Collection[dict[str, Any]],
+    search_params: CNVRegion,
+    check_type: bool = False,
+    projection: list[str] | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Yield the intersecting documents as the cursor fetches them, batch by batch."""
+    query = build_intersection_query(search_params, check_type)
 
+    with collection.find(query, build_projection(projection)) as cursor:
+        yield from cursor
+
+
+def iter_sorted_intersections(
+    collection: Collection[dict[str, Any]], search_params: CNVRegion, projection: list[str] | None = None
+) -> Iterator[dict[str, Any]]:
+    """Yield the intersecting documents ordered by start (and _id), e.g. for a sweep line. Best with a start index."""
+    query = build_intersection_query(search_params)
+
+    with collection.find(query, build_projection(projection)).sort([("start", 1), ("_id", 1)]) as cursor:
+        yield from cursor
+
+
+def find_intersections(
+    collection: Collection[dict[str, Any]],
+    search_params: CNVRegion,
+    check_type: bool = False,
+    projection: list[str] | None = None,
+) -> list[dict[str, Any]]:
+    return list(iter_intersections(collection, search_params, check_type, projection))
+
+
+def consume_documents(collection_name: str, documents: Iterable[dict[str, Any]], consumer: DocumentConsumer) -> None:
+    """Feed the documents of a query to the consumer, timing the query and counting its documents."""
+    with log_duration(logger, "query", labels={"collection": collection_name}) as fields:
+        count = 0
+        for doc in documents:
+            consumer.consume(doc)
+            count += 1
+        fields["documents"] = count
+
+
+def stream_documents(data: dict[str, list[dict[str, Any]]], consumers: dict[str, DocumentConsumer]) -> None:
+    """Feed already fetched documents to the consumer of their collection, for parsers that do not stream."""
+    for collection_name, consumer in consumers.items():
+        for doc in data[collection_name]:
+            consumer.consume(doc)
+
+
+def count_by(field: str) -> list[dict[str, Any]]:
+    """Facet pipeline counting documents per value of the field, the server-side variant of iterate_sv_info."""
+    return [{"$match": {field: {"$exists": True}}}, {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+
+
+def counts_from_facet(facet: list[dict[str, Any]]) -> dict[Any, int]:
+    return {doc["_id"]: doc["count"] for doc in facet}
+
+
+def facet_intersections(
+    collection: Collection[dict[str, Any]],
+    search_params: CNVRegion,
+    facets: dict[str, list[dict[str, Any]]],
+    check_type: bool = False,
+) -> dict[str, list[dict[str, Any]]]:
+    """Run the facet pipelines over the intersecting documents server-side, returning only their (small) results."""
+    pipeline = [{"$match": build_intersection_query(search_params, check_type)}, {"$facet": facets}]
+    with collection.aggregate(pipeline) as cursor:
+        return next(cursor)
+
+
+def iter_aggregated_intersections(
+    db: Database[dict[str, Any]],
+    collection_names: list[str],
+    search_params: CNVRegion,
+    check_type_names: list[str],
+    projections: dict[str, list[str]],
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    """Yield (collection name, document) of intersections from all collections using $unionWith (MongoDB 4.4+)."""
+
+    def collection_pipeline(collection_name: str) -> list[dict[str, Any]]:
+        pipeline: list[dict[str, Any]] = [
+            {"$match": build_intersection_query(search_params, collection_name in check_type_names)}
+        ]
+        projection = build_projection(projections.get(collection_name))
+        if projection is not None:
+            pipeline.append({"$project": projection})
+        pipeline.append({"$addFields": {"_collection": collection_name}})
+        return pipeline
+
+    first, *others = collection_names
+    pipeline = collection_pipeline(first)
+    for collection_name in others:
+        pipeline.append({"$unionWith": {"coll": collection_name, "pipeline": collection_pipeline(collection_name)}})
+
+    with db[first].aggregate(pipeline) as cursor:
+        for doc in cursor:
+            yield doc.pop("_collection"), doc
+
+
+def aggregate_intersections(
+    db: Database[dict[str, Any]],
+    collection_names: list[str],
+    search_params: CNVRegion,
+    check_type_names: list[str],
+    projections: dict[str, list[str]],
+) -> dict[str, list[dict[str, Any]]]:
+    """Fetch intersections from all collections in a single round-trip, see iter_aggregated_intersections."""
+    results: dict[str, list[dict[str, Any]]] = {collection_name: [] for collection_name in collection_names}
+    for collection_name, doc in iter_aggregated_intersections(
+        db, collection_names, search_params, check_type_names, projections
+    ):
+        results[collection_name].append(doc)
     return results
 
 
 class IntersectionCollectionsParser:
     db: Database[dict[str, Any]]
 
-    def __init__(self, uri: str, db_name: str, collection_names: list[str], check_type_names: list[str]):
+    def __init__(
+        self,
+        uri: str,
+        db_name: str,
+        collection_names: list[str],
+        check_type_names: list[str],
+        projections: dict[str, list[str]] | None = None,
+        query_mode: QueryMode = QueryMode.SEQUENTIAL,
+        source_version: str | None = None,
+    ):
         self.db = get_mongo_database(uri, db_name)
         self.collection_names = collection_names
         self.check_type_names = check_type_names
+        self.projections = projections or {}
+        self.query_mode = query_mode
+        self.source_version = source_version
+        # created upfront, so that threads sharing the parser also share the executor
+        self._executor = (
+            ThreadPoolExecutor(max_workers=len(collection_names)) if query_mode == QueryMode.CONCURRENT else None
+        )
+
+    @functools.cached_property
+    def source_fingerprint(self) -> str:
+        """Fingerprint of the collections, computed once per parser."""
+        return get_source_fingerprint(self.db, self.collection_names, self.projections, self.source_version)
+
+    def ping(self, timeout: float = 2.0) -> bool:
+        """Whether MongoDB responds within the timeout (in seconds)."""
+        try:
+            with pymongo.timeout(timeout):
+                self.db.command("ping")
+            return True
+        except PyMongoError:
+            return False
+
+    def _iter(self, collection_name: str, region: CNVRegion) -> Iterator[dict[str, Any]]:
+        return iter_intersections(
+            self.db[collection_name],
+            region,
+            collection_name in self.check_type_names,
+            self.projections.get(collection_name),
+        )
+
+    def scan_sorted(self, collection_name: str, region: CNVRegion) -> Iterator[dict[str, Any]]:
+        return iter_sorted_intersections(self.db[collection_name], region, self.projections.get(collection_name))
+
+    def _find(self, collection_name: str, region: CNVRegion) -> list[dict[str, Any]]:
+        with log_duration(logger, "query", labels={"collection": collection_name}) as fields:
+            documents = list(self._iter(collection_name, region))
+            fields["documents"] = len(documents)
+        return documents
+
+    def _map_collections(self, collection_names: list[str], func: Callable[[str], T]) -> dict[str, T]:
+        if self._executor is not None:
+            futures = {name: self._executor.submit(func, name) for name in collection_names}
+            return {name: future.result() for name, future in futures.items()}
+        return {collection_name: func(collection_name) for collection_name in collection_names}
+
+    def facet_for_region(
+        self, region: CNVRegion, facets: dict[str, dict[str, list[dict[str, Any]]]]
+    ) -> dict[str, dict[str, list[dict[str, Any]]]]:
+        """Run the given facet pipelines per collection, see facet_intersections."""
+        return self._map_collections(
+            list(facets),
+            lambda name: facet_intersections(self.db[name], region, facets[name], name in self.check_type_names),
+        )
 
     def get_for_region(self, region: CNVRegion) -> dict[str, list[dict[str, Any]]]:
-        return {
-            collection_name: find_intersections(
-                self.db[collection_name], region, collection_name in self.check_type_names
-            )
-            for collection_name in self.collection_names
-        }
+        if self.query_mode == QueryMode.UNION:
+            with log_duration(logger, "query", labels={"collection": QueryMode.UNION}) as fields:
+                data = aggregate_intersections(
+                    self.db, self.collection_names, region, self.check_type_names, self.projections
+                )
+                fields["documents"] = sum(len(documents) for documents in data.values())
+            return data
+
+        return self._map_collections(self.collection_names, lambda name: self._find(name, region))
+
+    def stream_for_region(self, region: CNVRegion, consumers: dict[str, DocumentConsumer]) -> None:
+        """Feed the consumers straight from the cursors. Concurrently, each collection is consumed by its own thread."""
+        if self.query_mode == QueryMode.UNION:
+            with log_duration(logger, "query", labels={"collection": QueryMode.UNION}) as fields:
+                count = 0
+                for collection_name, doc in iter_aggregated_intersections(
+                    self.db, list(consumers), region, self.check_type_names, self.projections
+                ):
+                    consumers[collection_name].consume(doc)
+                    count += 1
+                fields["documents"] = count
+            return
+
+        def stream(collection_name: str) -> None:
+            consume_documents(collection_name, self._iter(collection_name, region), consumers[collection_name])
+
+        self._map_collections(list(consumers), stream)
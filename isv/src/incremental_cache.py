@@ -0,0 +1,126 @@
+import collections
+import dataclasses
+import threading
+from typing import Any, Iterator
+
+from isv.src.annotation_cache import CacheStats
+from isv.src.cnv_region import CNVRegion
+from isv.src.dict_utils import DocumentConsumer
+from isv.src.genovisio_sources_db import CollectionsParser, stream_documents
+
+RegionDocuments = dict[str, list[dict[str, Any]]]
+
+
+def get_extension(base: CNVRegion, region: CNVRegion) -> int:
+    """Length of the parts of the region outside of the base region."""
+    return max(base.start - region.start, 0) + max(region.end - base.end, 0)
+
+
+def get_extension_regions(base: CNVRegion, region: CNVRegion) -> list[CNVRegion]:
+    """Parts of the region outside of the overlapping base region, to be queried in addition to the base documents."""
+    extensions = []
+    if region.start < base.start:
+        extensions.append(dataclasses.replace(region, end=base.start - 1))
+    if region.end > base.end:
+        extensions.append(dataclasses.replace(region, start=base.end + 1))
+    return extensions
+
+
+def merge_documents(
+    region: CNVRegion, base_data: RegionDocuments, extension_data: list[RegionDocuments]
+) -> RegionDocuments:
+    """Base documents still intersecting the region in their order, followed by the new documents of the extensions."""
+    merged = {}
+    for collection_name, base_documents in base_data.items():
+        documents = {
+            doc["_id"]: doc for doc in base_documents if doc["start"] <= region.end and doc["end"] >= region.start
+        }
+        for data in extension_data:
+            for doc in data[collection_name]:
+                documents.setdefault(doc["_id"], doc)
+        merged[collection_name] = list(documents.values())
+    return merged
+
+
+class IncrementalCollectionsParser:
+    """Wraps a collections parser, answering regions that overlap a recently queried one by querying only the difference.
+
+    The documents of the max_regions most recently used regions are kept. A kept region of the same chromosome and CNV
+    type is reused if the new region extends it by at most max_extension_fraction of the new region's length; documents
+    outside of the new region are dropped and the documents of the extensions are queried and added.
+    """
+
+    def __init__(self, collection_parser: CollectionsParser, max_regions: int, max_extension_fraction: float = 0.5):
+        self.collection_parser = collection_parser
+        self.max_regions = max_regions
+        self.max_extension_fraction = max_extension_fraction
+        self.stats = CacheStats()
+        self.requested_length = 0
+        self.queried_length = 0
+        self._regions: collections.OrderedDict[str, tuple[CNVRegion, RegionDocuments]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def source_fingerprint(self) -> str:
+        return self.collection_parser.source_fingerprint
+
+    @property
+    def check_type_names(self) -> list[str]:
+        return self.collection_parser.check_type_names
+
+    def _find_base(self, region: CNVRegion) -> tuple[CNVRegion, RegionDocuments] | None:
+        candidates = [
+            (get_extension(base, region), base, data)
+            for base, data in self._regions.values()
+            if base.chr == region.chr
+            and base.cnv_type == region.cnv_type
+            and base.start <= region.end
+            and base.end >= region.start
+        ]
+        if not candidates:
+            return None
+        extension, base, data = min(candidates, key=lambda candidate: candidate[0])
+        if extension > self.max_extension_fraction * region.length:
+            return None
+        self._regions.move_to_end(base.name)
+        return base, data
+
+    def get_for_region(self, region: CNVRegion) -> RegionDocuments:
+        with self._lock:
+            base = self._find_base(region)
+
+        if base is None:
+            queried_regions = [region]
+            data = self.collection_parser.get_for_region(region)
+        else:
+            queried_regions = get_extension_regions(base[0], region)
+            extension_data = [self.collection_parser.get_for_region(extension) for extension in queried_regions]
+            data = merge_documents(region, base[1], extension_data)
+
+        with self._lock:
+            self.stats.count(base is not None)
+            self.requested_length += region.length
+            self.queried_length += sum(queried_region.length for queried_region in queried_regions)
+            self._regions[region.name] = (region, data)
+            self._regions.move_to_end(region.name)
+            while len(self._regions) > self.max_regions:
+                self._regions.popitem(last=False)
+        return data
+
+    def stream_for_region(self, region: CNVRegion, consumers: dict[str, DocumentConsumer]) -> None:
+        # the documents are kept for reuse anyway, so they are fetched in full
+        stream_documents(self.get_for_region(region), consumers)
+
+    def scan_sorted(self, collection_name: str, region: CNVRegion) -> Iterator[dict[str, Any]]:
+        # a scan covers many regions at once, so it bypasses the cache
+        return self.collection_parser.scan_sorted(collection_name, region)
+
+    def describe(self) -> dict[str, Any]:
+        """Reused and fully queried regions, and the share of the requested bases actually queried."""
+        return {
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "size": len(self._regions),
+            "max_size": self.max_regions,
+            "queried_fraction": self.queried_length / self.requested_length if self.requested_length else 0.0,
+        }
@@ -0,0 +1,288 @@
+"""Instrumentation of the ISV stages.
+
+Timings and document counts are logged at INFO (full payloads only at DEBUG) and, if enabled, recorded in METRICS,
+which reports them as a JSON profile or in the Prometheus text format.
+"""
+
+import argparse
+import contextlib
+import enum
+import json
+import logging
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+from isv.src.dict_utils import DocumentConsumer
+
+# configuration of this process, handed over to worker processes
+_log_config: tuple[str, str] | None = None
+
+
+class LogLevel(enum.StrEnum):
+    DEBUG = "debug"
+    INFO = "info"
+    WARNING = "warning"
+    ERROR = "error"
+
+
+class LogFormat(enum.StrEnum):
+    TEXT = "text"
+    JSON = "json"
+
+
+def get_fields(record: logging.LogRecord) -> dict[str, Any]:
+    """Structured fields of the record, passed as logger.info(message, extra={"fields": {...}})."""
+    return getattr(record, "fields", {})
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with the fields appended as key=value."""
+
+    def __init__(self) -> None:
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={json.dumps(value, default=str)}" for key, value in get_fields(record).items())
+        return f"{line} {fields}" if fields else line
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the fields as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **get_fields(record),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def configure_logging(level: str = LogLevel.WARNING, log_format: str = LogFormat.TEXT) -> None:
+    """Log records of the isv loggers at the level and above to stderr."""
+    global _log_config
+    _log_config = (level, log_format)
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JSONFormatter() if log_format == LogFormat.JSON else TextFormatter())
+    logger = logging.getLogger("isv")
+    logger.handlers = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+def get_log_config() -> tuple[str, str] | None:
+    """Level and format set by configure_logging, None if logging was not configured."""
+    return _log_config
+
+
+def add_logging_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--log_level",
+        help="Log stage timings and document counts (info), or also the full payloads (debug)",
+        choices=list(LogLevel),
+        type=LogLevel,
+        default=LogLevel.WARNING,
+    )
+    parser.add_argument(
+        "--log_format", help="Format of the log lines", choices=list(LogFormat), type=LogFormat, default=LogFormat.TEXT
+    )
+
+
+def configure_logging_from_args(args: argparse.Namespace) -> None:
+    configure_logging(args.log_level, args.log_format)
+
+
+# upper bounds (in seconds) of the histogram buckets, from sub-millisecond annotator passes to minutes-long batches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+@dataclass
+class Histogram:
+    """Durations of one stage and label set, bucketed cumulatively as in Prometheus."""
+
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    bucket_counts: list[int] = field(default_factory=list)
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def __post_init__(self) -> None:
+        self.bucket_counts = self.bucket_counts or [0] * len(self.buckets)
+
+    def observe(self, seconds: float) -> None:
+        for i, upper_bound in enumerate(self.buckets):
+            if seconds <= upper_bound:
+                self.bucket_counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "Histogram") -> None:
+        self.bucket_counts = [a + b for a, b in zip(self.bucket_counts, other.bucket_counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+
+def format_labels(labels: Labels, **extra: str) -> str:
+    items = [*labels, *extra.items()]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}" if items else ""
+
+
+class MetricsRegistry:
+    """Stage durations and counts of this process, keyed by stage and labels. Disabled by default. Thread-safe."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+        self._counters: dict[tuple[str, Labels], int] = {}
+
+    def observe(self, stage: str, seconds: float, labels: dict[str, str] | None = None) -> None:
+        key = (stage, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._histograms.setdefault(key, Histogram()).observe(seconds)
+
+    def increment(self, name: str, value: int, labels: dict[str, str] | None = None) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def pop_snapshot(self) -> tuple[dict[tuple[str, Labels], Histogram], dict[tuple[str, Labels], int]]:
+        """Metrics recorded since the last snapshot, e.g. to be merged by the parent of a worker process."""
+        with self._lock:
+            snapshot = (self._histograms, self._counters)
+            self._histograms, self._counters = {}, {}
+        return snapshot
+
+    def merge(self, snapshot: tuple[dict[tuple[str, Labels], Histogram], dict[tuple[str, Labels], int]]) -> None:
+        histograms, counters = snapshot
+        with self._lock:
+            for key, histogram in histograms.items():
+                self._histograms.setdefault(key, Histogram()).merge(histogram)
+            for key, value in counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def report(self) -> dict[str, Any]:
+        """Profile of the stages: number of calls, total, mean and max wall time, and the counts."""
+        with self._lock:
+            stages = [
+                {
+                    "stage": stage,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "total_seconds": histogram.total,
+                    "mean_seconds": histogram.total / histogram.count,
+                    "max_seconds": histogram.max,
+                }
+                for (stage, labels), histogram in sorted(self._histograms.items())
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+        return {"stages": stages, "counters": counters}
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP isv_stage_duration_seconds Wall time of the ISV stages",
+            "# TYPE isv_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (stage, labels), histogram in sorted(self._histograms.items()):
+                stage_labels: Labels = (("stage", stage), *labels)
+                for upper_bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(
+                        f"isv_stage_duration_seconds_bucket{format_labels(stage_labels, le=str(upper_bound))} "
+                        f"{bucket_count}"
+                    )
+                lines.append(
+                    f"isv_stage_duration_seconds_bucket{format_labels(stage_labels, le='+Inf')} {histogram.count}"
+                )
+                lines.append(f"isv_stage_duration_seconds_sum{format_labels(stage_labels)} {histogram.total}")
+                lines.append(f"isv_stage_duration_seconds_count{format_labels(stage_labels)} {histogram.count}")
+
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE isv_{name}_total counter")
+                for (counter_name, labels), value in sorted(self._counters.items()):
+                    if counter_name == name:
+                        lines.append(f"isv_{name}_total{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+@contextlib.contextmanager
+def log_duration(
+    logger: logging.Logger, stage: str, labels: dict[str, str] | None = None, **fields: Any
+) -> Iterator[dict[str, Any]]:
+    """Time the stage, logging it at INFO and recording it in METRICS once it finishes.
+
+    Fields added to the yielded dict are logged too, and their integer values are counted in METRICS as
+    "<stage>_<field>" (e.g. query_documents). Labels go to both and should have few distinct values (no regions).
+    """
+    log = logger.isEnabledFor(logging.INFO)
+    if not log and not METRICS.enabled:
+        yield fields
+        return
+
+    start = time.perf_counter()
+    yield fields
+    seconds = time.perf_counter() - start
+
+    if METRICS.enabled:
+        METRICS.observe(stage, seconds, labels)
+        for key, value in fields.items():
+            if isinstance(value, int) and not isinstance(value, bool):
+                METRICS.increment(f"{stage}_{key}", value, labels)
+    if log:
+        logger.info(stage, extra={"fields": {**(labels or {}), **fields, "duration_ms": round(seconds * 1000, 3)}})
+
+
+class TimedConsumer:
+    """Wraps a document consumer, adding up the time spent in it."""
+
+    def __init__(self, consumer: DocumentConsumer):
+        self.consumer = consumer
+        self.seconds = 0.0
+
+    def consume(self, doc: dict[str, Any]) -> None:
+        start = time.perf_counter()
+        self.consumer.consume(doc)
+        self.seconds += time.perf_counter() - start
+
+
+def add_profiling_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile", help="Path to store the wall time and counts of each stage as a JSON report", default=None
+    )
+    parser.add_argument(
+        "--metrics_output", help="Path to store the stage metrics in the Prometheus text format", default=None
+    )
+
+
+def enable_metrics_from_args(args: argparse.Namespace) -> None:
+    METRICS.enabled = bool(args.profile or args.metrics_output)
+
+
+def write_reports_from_args(args: argparse.Namespace) -> None:
+    """Store the --profile and --metrics_output reports, if requested."""
+    if args.profile:
+        with open(args.profile, "w") as f:
+            json.dump(METRICS.report(), f, indent=2)
+    if args.metrics_output:
+        with open(args.metrics_output, "w") as f:
+            f.write(METRICS.to_prometheus())
@@ -0,0 +1,148 @@
+import hashlib
+import math
+import os
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+from bson import json_util
+
+from isv.src.cnv_region import CNVRegion
+from isv.src.dict_utils import DocumentConsumer
+from isv.src.genovisio_sources_db import consume_documents
+
+# Intervals are binned by length (powers of _BIN_BASE), so each bin only needs to look back by its own longest interval
+_BIN_BASE = 4
+
+
+class IntervalBin:
+    """Intervals of one chromosome and length bin, sorted by start."""
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, doc_ids: np.ndarray, max_length: int):
+        self.starts = starts
+        self.ends = ends
+        self.doc_ids = doc_ids
+        self.max_length = max_length
+
+    @classmethod
+    def from_unsorted(cls, starts: list[int], ends: list[int], doc_ids: list[int]) -> "IntervalBin":
+        order = np.argsort(starts, kind="stable")
+        starts_array = np.asarray(starts, dtype=np.int64)[order]
+        ends_array = np.asarray(ends, dtype=np.int64)[order]
+        max_length = int((ends_array - starts_array).max()) if len(starts_array) else 0
+        return cls(starts_array, ends_array, np.asarray(doc_ids, dtype=np.int64)[order], max_length)
+
+    def query(self, start: int, end: int) -> np.ndarray:
+        return self.query_sorted(start, end)[1]
+
+    def query_sorted(self, start: int, end: int) -> tuple[np.ndarray, np.ndarray]:
+        """Starts and document ids of the intervals intersecting start..end, sorted by start."""
+        lo = np.searchsorted(self.starts, start - self.max_length, side="left")
+        hi = np.searchsorted(self.starts, end, side="right")
+        hits = self.ends[lo:hi] >= start
+        return self.starts[lo:hi][hits], self.doc_ids[lo:hi][hits]
+
+
+def bin_intervals(documents: Iterable[dict[str, Any]]) -> dict[str, list[IntervalBin]]:
+    """Group the documents by chromosome and length bin. Document ids are their positions in the iterable."""
+    intervals: dict[tuple[str, int], tuple[list[int], list[int], list[int]]] = {}
+    for doc_id, doc in enumerate(documents):
+        length = max(doc["end"] - doc["start"], 1)
+        starts, ends, doc_ids = intervals.setdefault(
+            (doc["chromosome"], int(math.log(length, _BIN_BASE))), ([], [], [])
+        )
+        starts.append(doc["start"])
+        ends.append(doc["end"])
+        doc_ids.append(doc_id)
+
+    bins: dict[str, list[IntervalBin]] = {}
+    for (chromosome, _), (starts, ends, doc_ids) in intervals.items():
+        bins.setdefault(chromosome, []).append(IntervalBin.from_unsorted(starts, ends, doc_ids))
+    return bins
+
+
+class IntervalIndex:
+    """In-memory overlap index over the documents of one collection, queried in O(log n + k) per length bin."""
+
+    def __init__(self, documents: Iterable[dict[str, Any]]):
+        self.documents = list(documents)
+        self.bins = bin_intervals(self.documents)
+
+    def get_documents(self, doc_ids: np.ndarray) -> list[dict[str, Any]]:
+        return [self.documents[doc_id] for doc_id in doc_ids]
+
+    def query(self, chromosome: str, start: int, end: int) -> list[dict[str, Any]]:
+        """Documents with start <= end and end >= start on the chromosome, in their original order."""
+        hits = [interval_bin.query(start, end) for interval_bin in self.bins.get(chromosome, [])]
+        if not hits:
+            return []
+        return self.get_documents(np.sort(np.concatenate(hits)))
+
+    def iter_sorted(self, chromosome: str, start: int, end: int, chunk_size: int = 1024) -> Iterator[dict[str, Any]]:
+        """Same documents as query(), in order of their start (then original order), decoded chunk by chunk."""
+        hits = [interval_bin.query_sorted(start, end) for interval_bin in self.bins.get(chromosome, [])]
+        if not hits:
+            return
+        starts = np.concatenate([bin_starts for bin_starts, _ in hits])
+        doc_ids = np.concatenate([bin_doc_ids for _, bin_doc_ids in hits])
+        doc_ids = doc_ids[np.lexsort((doc_ids, starts))]
+        for offset in range(0, len(doc_ids), chunk_size):
+            yield from self.get_documents(doc_ids[offset : offset + chunk_size])
+
+    def find_intersections(self, search_params: CNVRegion, check_type: bool = False) -> list[dict[str, Any]]:
+        results = self.query(search_params.chr, search_params.start, search_params.end)
+        if check_type:
+            results = [doc for doc in results if doc.get("cnv_type") == search_params.cnv_type]
+        return results
+
+
+def read_exported_collection(path: str) -> Iterable[dict[str, Any]]:
+    """Read a collection exported by mongoexport (one Extended JSON document per line)."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json_util.loads(line)
+
+
+def get_files_fingerprint(paths: list[str]) -> str:
+    """Checksum of the contents of the files."""
+    checksum = hashlib.md5()
+    for path in paths:
+        with open(path, "rb") as f:
+            checksum.update(hashlib.file_digest(f, "md5").digest())
+    return checksum.hexdigest()
+
+
+class IntervalIndexCollectionsParser:
+    """Offline replacement of IntersectionCollectionsParser, answering get_for_region from in-memory indexes."""
+
+    def __init__(self, indexes: dict[str, IntervalIndex], check_type_names: list[str], source_fingerprint: str = ""):
+        self.indexes = indexes
+        self.check_type_names = check_type_names
+        self.source_fingerprint = source_fingerprint
+
+    @classmethod
+    def from_export_dir(
+        cls, export_dir: str, collection_names: list[str], check_type_names: list[str]
+    ) -> "IntervalIndexCollectionsParser":
+        """Build from "<collection>.json" files created by `mongoexport --collection <collection>`."""
+        paths = {name: os.path.join(export_dir, f"{name}.json") for name in collection_names}
+        return cls(
+            {name: IntervalIndex(read_exported_collection(path)) for name, path in paths.items()},
+            check_type_names,
+            source_fingerprint=get_files_fingerprint(list(paths.values())),
+        )
+
+    def get_for_region(self, region: CNVRegion) -> dict[str, list[dict[str, Any]]]:
+        return {
+            collection_name: index.find_intersections(region, collection_name in self.check_type_names)
+            for collection_name, index in self.indexes.items()
+        }
+
+    def scan_sorted(self, collection_name: str, region: CNVRegion) -> Iterator[dict[str, Any]]:
+        return self.indexes[collection_name].iter_sorted(region.chr, region.start, region.end)
+
+    def stream_for_region(self, region: CNVRegion, consumers: dict[str, DocumentConsumer]) -> None:
+        for collection_name, consumer in consumers.items():
+            check_type = collection_name in self.check_type_names
+            documents = self.indexes[collection_name].find_intersections(region, check_type)
+            consume_documents(collection_name, documents, consumer)
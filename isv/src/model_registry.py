@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from isv.src import cnv_region
+from isv.src.compiled_model import CompiledModel
+from isv.src.instrumentation import log_duration
+
+if TYPE_CHECKING:
+    import shap
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "models"))
+
+
+def format_model_path(cnvtype: cnv_region.CNVType, models_dir: str = DEFAULT_MODELS_DIR) -> str:
+    models_name = f"isv2_{cnvtype}.json"
+    return os.path.join(models_dir, models_name)
+
+
+def format_compiled_model_path(cnvtype: cnv_region.CNVType, models_dir: str = DEFAULT_MODELS_DIR) -> str:
+    return os.path.join(models_dir, f"isv2_{cnvtype}.npz")
+
+
+class ModelRegistry:
+    """Lazily loads each model and its SHAP TreeExplainer once per process, keyed by CNV type. Thread-safe.
+
+    If compiled, predictions are scored by the compiled models (see compiled_model), loaded without xgboost.
+    """
+
+    def __init__(self, models_dir: str = DEFAULT_MODELS_DIR):
+        self.models_dir = models_dir
+        self.compiled = False
+        self._lock = threading.Lock()
+        self._models: dict[cnv_region.CNVType, Any] = {}
+        self._explainers: dict[cnv_region.CNVType, "shap.TreeExplainer"] = {}
+        self._compiled_models: dict[cnv_region.CNVType, CompiledModel] = {}
+
+    def set_models_dir(self, models_dir: str) -> None:
+        """Switch to models stored in another directory. Already loaded models are dropped."""
+        with self._lock:
+            self.models_dir = os.path.abspath(models_dir)
+            self._models.clear()
+            self._explainers.clear()
+            self._compiled_models.clear()
+
+    def is_loaded(self, cnvtype: cnv_region.CNVType, explain: bool = True) -> bool:
+        """Whether the model (compiled if compiled), and its explainer if explain, are loaded."""
+        models = self._compiled_models if self.compiled else self._models
+        return cnvtype in models and (not explain or cnvtype in self._explainers)
+
+    def get_model(self, cnvtype: cnv_region.CNVType) -> Any:
+        model = self._models.get(cnvtype)
+        if model is not None:
+            return model
+        with self._lock:
+            if cnvtype not in self._models:
+                model_path = format_model_path(cnvtype, self.models_dir)
+                import joblib
+
+                with log_duration(logger, "load_model", labels={"cnv_type": cnvtype}, path=model_path):
+                    self._models[cnvtype] = joblib.load(model_path)
+            return self._models[cnvtype]
+
+    def get_compiled_model(self, cnvtype: cnv_region.CNVType) -> CompiledModel:
+        model = self._compiled_models.get(cnvtype)
+        if model is not None:
+            return model
+        with self._lock:
+            if cnvtype not in self._compiled_models:
+                model_path = format_compiled_model_path(cnvtype, self.models_dir)
+                with log_duration(logger, "load_model", labels={"cnv_type": cnvtype}, path=model_path):
+                    self._compiled_models[cnvtype] = CompiledModel.load(model_path)
+            return self._compiled_models[cnvtype]
+
+    def get_explainer(self, cnvtype: cnv_region.CNVType) -> "shap.TreeExplainer":
+        import shap
+
+        explainer = self._explainers.get(cnvtype)
+        if explainer is not None:
+            return explainer
+        model = self.get_model(cnvtype)
+        with self._lock:
+            if cnvtype not in self._explainers:
+                with log_duration(logger, "load_explainer", labels={"cnv_type": cnvtype}):
+                    self._explainers[cnvtype] = shap.TreeExplainer(model)
+            return self._explainers[cnvtype]
+
+    def preload(self, cnvtypes: list[cnv_region.CNVType] | None = None, explain: bool = True) -> None:
+        """Load the models, and build their explainers if explain, ahead of the first prediction."""
+        for cnvtype in cnvtypes or list(cnv_region.CNVType):
+            if self.compiled:
+                self.get_compiled_model(cnvtype)
+            if explain:
+                self.get_explainer(cnvtype)
+            elif not self.compiled:
+                self.get_model(cnvtype)
+
+    def warm(self, cnvtypes: list[cnv_region.CNVType] | None = None, explain: bool = True) -> None:
+        """Preload and run one dummy prediction (and SHAP pass) per model, so the first real call is not slower."""
+        for cnvtype in cnvtypes or list(cnv_region.CNVType):
+            if self.compiled:
+                compiled_model = self.get_compiled_model(cnvtype)
+                dummy = np.zeros((1, len(compiled_model.feature_names)), dtype=np.float32)
+                compiled_model.predict(dummy)
+            else:
+                import xgboost as xgb
+
+                model = self.get_model(cnvtype)
+                dummy = np.zeros((1, len(model.feature_names)), dtype=np.float32)
+                model.predict(xgb.DMatrix(dummy, feature_names=model.feature_names))
+            if explain:
+                self.get_explainer(cnvtype).shap_values(dummy)
+
+
+MODEL_REGISTRY = ModelRegistry()
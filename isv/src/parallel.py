@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import concurrent.futures
+import enum
+import functools
+import multiprocessing
+from typing import Any, AsyncGenerator, Callable, Iterable, Iterator, TypeVar
+
+from isv.annotate import CNVAnnotation, annotate, annotate_async
+from isv.src.async_sources_db import AsyncCollectionsParser
+from isv.src.cnv_region import CNVRegion
+from isv.src.genovisio_sources_db import CollectionsParser
+from isv.src.instrumentation import METRICS, configure_logging, get_log_config
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class ParallelBackend(enum.StrEnum):
+    PROCESS = "process"
+    THREAD = "thread"
+    ASYNCIO = "asyncio"
+
+
+def bounded_map(
+    executor: concurrent.futures.Executor,
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_in_flight: int,
+    ordered: bool = True,
+) -> Iterator[R]:
+    """Like Executor.map, but consumes the items lazily and keeps at most max_in_flight of them submitted."""
+    in_flight: collections.deque[concurrent.futures.Future[R]] = collections.deque()
+    pending: set[concurrent.futures.Future[R]] = set()
+
+    for item in items:
+        future = executor.submit(func, item)
+        if ordered:
+            in_flight.append(future)
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+        else:
+            pending.add(future)
+            if len(pending) >= max_in_flight:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                yield from (future.result() for future in done)
+
+    yield from (future.result() for future in in_flight)
+    yield from (future.result() for future in concurrent.futures.as_completed(pending))
+
+
+# state of a worker process, set by _init_worker after the process starts
+_worker_parser: CollectionsParser | None = None
+_worker_annotate_func: Callable[..., CNVAnnotation] = annotate
+
+
+def _init_worker(
+    parser_factory: Callable[[], CollectionsParser],
+    annotate_func: Callable[..., CNVAnnotation],
+    log_config: tuple[str, str] | None,
+    metrics_enabled: bool,
+) -> None:
+    global _worker_parser, _worker_annotate_func
+    if log_config is not None:
+        configure_logging(*log_config)
+    METRICS.enabled = metrics_enabled
+    _worker_parser = parser_factory()
+    _worker_annotate_func = annotate_func
+
+
+def _annotate_in_worker(region: CNVRegion) -> tuple[CNVAnnotation, Any]:
+    """The annotation and, if enabled, the metrics recorded since the previous region, for the parent to merge."""
+    annotation = _worker_annotate_func(region=region, collection_parser=_worker_parser)
+    return annotation, METRICS.pop_snapshot() if METRICS.enabled else None
+
+
+def annotate_many(
+    regions: Iterable[CNVRegion],
+    parser_factory: Callable[[], CollectionsParser],
+    annotate_func: Callable[..., CNVAnnotation] = annotate,
+    jobs: int = 1,
+    backend: ParallelBackend = ParallelBackend.PROCESS,
+    ordered: bool = True,
+    max_in_flight: int | None = None,
+) -> Iterator[CNVAnnotation]:
+    """Annotate many regions using a pool of jobs, yielding the annotations as they are ready.
+
+    The process backend creates the collections parser (and so its MongoClient) inside each worker after it starts,
+    as pymongo clients must not be shared across fork. Its parser_factory and annotate_func must be picklable.
+    The thread backend shares a single parser, which suits the I/O-bound MongoDB queries.
+    At most max_in_flight regions (default 4 per job) are queued, so memory stays flat for any number of regions.
+    """
+    max_in_flight = max_in_flight or 4 * jobs
+    if jobs <= 1:
+        collection_parser = parser_factory()
+        yield from (annotate_func(region=region, collection_parser=collection_parser) for region in regions)
+        return
+
+    executor: concurrent.futures.Executor
+    if backend == ParallelBackend.THREAD:
+        collection_parser = parser_factory()
+
+        def annotate_region(region: CNVRegion) -> CNVAnnotation:
+            return annotate_func(region=region, collection_parser=collection_parser)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            yield from bounded_map(executor, annotate_region, regions, max_in_flight, ordered)
+        return
+
+    initializer = functools.partial(_init_worker, parser_factory, annotate_func, get_log_config(), METRICS.enabled)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, mp_context=multiprocessing.get_context("forkserver"), initializer=initializer
+    ) as executor:
+        for annotation, metrics in bounded_map(executor, _annotate_in_worker, regions, max_in_flight, ordered):
+            if metrics is not None:
+                METRICS.merge(metrics)
+            yield annotation
+
+
+async def annotate_many_async(
+    regions: Iterable[CNVRegion],
+    collection_parser: AsyncCollectionsParser,
+    max_in_flight: int,
+    ordered: bool = True,
+) -> AsyncGenerator[CNVAnnotation, None]:
+    """Annotate many regions concurrently in the running event loop, with at most max_in_flight regions at a time."""
+    in_flight: collections.deque[asyncio.Task[CNVAnnotation]] = collections.deque()
+    pending: set[asyncio.Task[CNVAnnotation]] = set()
+
+    try:
+        for region in regions:
+            task = asyncio.ensure_future(annotate_async(region=region, collection_parser=collection_parser))
+            if ordered:
+                in_flight.append(task)
+                if len(in_flight) >= max_in_flight:
+                    yield await in_flight.popleft()
+            else:
+                pending.add(task)
+                if len(pending) >= max_in_flight:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+
+        while in_flight:
+            yield await in_flight.popleft()
+        for next_done in asyncio.as_completed(pending):
+            yield await next_done
+    finally:
+        # the consumer stopped early, do not leave queries running
+        for task in [*in_flight, *pending]:
+            task.cancel()
+
+
+def annotate_many_asyncio(
+    regions: Iterable[CNVRegion],
+    parser_factory: Callable[[], AsyncCollectionsParser],
+    max_in_flight: int,
+    ordered: bool = True,
+) -> Iterator[CNVAnnotation]:
+    """Synchronous iterator over annotate_many_async, running its event loop whenever the next annotation is needed."""
+    loop = asyncio.new_event_loop()
+
+    async def create_parser() -> AsyncCollectionsParser:
+        return parser_factory()
+
+    try:
+        collection_parser = loop.run_until_complete(create_parser())
+        annotations = annotate_many_async(regions, collection_parser, max_in_flight, ordered)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(annotations.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            loop.run_until_complete(annotations.aclose())
+    finally:
+        loop.close()
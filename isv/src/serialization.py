@@ -0,0 +1,29 @@
+"""JSON encoding of the ISV results, by orjson if it is installed (`pip install isv[orjson]`), else by json.
+
+Both produce the same data. Compact output has no whitespace, pretty output is indented by two spaces.
+"""
+
+import json
+from typing import Any
+
+orjson: Any
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def dumps(data: Any, pretty: bool = False) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else None).decode()
+    if pretty:
+        return json.dumps(data, indent=2, ensure_ascii=False)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,200 @@
+"""Columnar, memory-mapped snapshot of the Genovisio source collections used by the annotation.
+
+Layout of the snapshot file: magic bytes, header length (little-endian uint64), Extended JSON header, then the arrays,
+each aligned to _ALIGNMENT bytes. Per collection, the header holds:
+- "start"/"end" in document order, and "bin_start"/"bin_end"/"bin_doc_id" sorted by start within each length bin
+- "bins" describing the chromosome, offset, size and longest interval of each bin
+- dictionary-encoded "columns": int32 codes in document order (-1 if the field is missing) and the dictionary of values
+Arrays are views into one read-only memory map, so parallel workers share a single copy in the page cache.
+"""
+
+import datetime
+import os
+from typing import Any, BinaryIO, Iterable
+
+import numpy as np
+from bson import json_util
+from pymongo.database import Database
+
+from isv.src import genovisio_sources_db
+from isv.src.interval_index import IntervalBin, IntervalIndex, IntervalIndexCollectionsParser, bin_intervals
+
+FORMAT_VERSION = 1
+_MAGIC = b"ISVSNAP\x00"
+_ALIGNMENT = 64
+_INTERVAL_FIELDS = ["_id", "chromosome", "start", "end"]
+
+
+class _ArrayWriter:
+    def __init__(self) -> None:
+        self.arrays: list[np.ndarray] = []
+        self.size = 0
+
+    def add(self, array: np.ndarray) -> dict[str, Any]:
+        self.size += -self.size % _ALIGNMENT
+        descriptor = {"offset": self.size, "dtype": array.dtype.str, "shape": list(array.shape)}
+        self.arrays.append(array)
+        self.size += array.nbytes
+        return descriptor
+
+    def write(self, f: BinaryIO) -> None:
+        written = 0
+        for array in self.arrays:
+            f.write(b"\x00" * (-written % _ALIGNMENT))
+            written += -written % _ALIGNMENT
+            f.write(array.tobytes())
+            written += array.nbytes
+
+
+def _encode_collection(documents: list[dict[str, Any]], writer: _ArrayWriter) -> dict[str, Any]:
+    bins = bin_intervals(documents)
+    bin_descriptors = []
+    offset = 0
+    for chromosome, chromosome_bins in bins.items():
+        for interval_bin in chromosome_bins:
+            size = len(interval_bin.starts)
+            bin_descriptors.append(
+                {"chromosome": chromosome, "offset": offset, "size": size, "max_length": interval_bin.max_length}
+            )
+            offset += size
+
+    all_bins = [interval_bin for chromosome_bins in bins.values() for interval_bin in chromosome_bins]
+
+    def concatenate(attribute: str) -> np.ndarray:
+        if not all_bins:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([getattr(interval_bin, attribute) for interval_bin in all_bins]).astype(np.int64)
+
+    columns: dict[str, Any] = {}
+    field_names = {field for doc in documents for field in doc if field not in _INTERVAL_FIELDS}
+    for field in sorted(field_names):
+        codes_by_value: dict[str, int] = {}
+        dictionary: list[Any] = []
+        codes = np.full(len(documents), -1, dtype=np.int32)
+        for doc_id, doc in enumerate(documents):
+            if field not in doc:
+                continue
+            key = json_util.dumps(doc[field])
+            if key not in codes_by_value:
+                codes_by_value[key] = len(dictionary)
+                dictionary.append(doc[field])
+            codes[doc_id] = codes_by_value[key]
+        columns[field] = {"codes": writer.add(codes), "dictionary": dictionary}
+
+    return {
+        "documents": len(documents),
+        "start": writer.add(np.array([doc["start"] for doc in documents], dtype=np.int64)),
+        "end": writer.add(np.array([doc["end"] for doc in documents], dtype=np.int64)),
+        "bins": bin_descriptors,
+        "bin_start": writer.add(concatenate("starts")),
+        "bin_end": writer.add(concatenate("ends")),
+        "bin_doc_id": writer.add(concatenate("doc_ids")),
+        "columns": columns,
+    }
+
+
+def write_snapshot(path: str, collections: dict[str, list[dict[str, Any]]], source_fingerprint: str) -> None:
+    writer = _ArrayWriter()
+    header = {
+        "format_version": FORMAT_VERSION,
+        "source_fingerprint": source_fingerprint,
+        "created": datetime.datetime.now(datetime.UTC).isoformat(),
+        "collections": {name: _encode_collection(documents, writer) for name, documents in collections.items()},
+    }
+    header_bytes = json_util.dumps(header).encode()
+    data_offset = len(_MAGIC) + 8 + len(header_bytes)
+    padding = -data_offset % _ALIGNMENT
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write((len(header_bytes) + padding).to_bytes(8, "little"))
+        f.write(header_bytes + b" " * padding)
+        writer.write(f)
+    os.replace(tmp_path, path)
+
+
+def build_snapshot(
+    db: Database[dict[str, Any]],
+    collection_names: list[str],
+    projections: dict[str, list[str]],
+    path: str,
+    source_version: str | None = None,
+) -> str:
+    """Dump the collections (only the projected fields) into a snapshot file. Returns the source fingerprint."""
+    fingerprint = genovisio_sources_db.get_source_fingerprint(db, collection_names, projections, source_version)
+    collections = {}
+    for name in collection_names:
+        projection = genovisio_sources_db.build_projection([*projections[name], "chromosome"])
+        with db[name].find({}, projection) as cursor:
+            collections[name] = list(cursor)
+    write_snapshot(path, collections, fingerprint)
+    return fingerprint
+
+
+class SnapshotIndex(IntervalIndex):
+    """IntervalIndex over the memory-mapped arrays of one collection, decoding only the documents that are hit."""
+
+    def __init__(self, header: dict[str, Any], array: Any):
+        self.doc_starts = array(header["start"])
+        self.doc_ends = array(header["end"])
+        self.columns = [
+            (field, array(column["codes"]), column["dictionary"]) for field, column in header["columns"].items()
+        ]
+
+        bin_starts, bin_ends, bin_doc_ids = (
+            array(header["bin_start"]),
+            array(header["bin_end"]),
+            array(header["bin_doc_id"]),
+        )
+        self.bins: dict[str, list[IntervalBin]] = {}
+        for descriptor in header["bins"]:
+            window = slice(descriptor["offset"], descriptor["offset"] + descriptor["size"])
+            self.bins.setdefault(descriptor["chromosome"], []).append(
+                IntervalBin(bin_starts[window], bin_ends[window], bin_doc_ids[window], descriptor["max_length"])
+            )
+
+    def get_documents(self, doc_ids: np.ndarray) -> list[dict[str, Any]]:
+        documents = []
+        for doc_id in doc_ids.tolist():
+            # the position in the snapshot stands in for the MongoDB _id, it is unique within the collection
+            doc: dict[str, Any] = {
+                "_id": doc_id,
+                "start": int(self.doc_starts[doc_id]),
+                "end": int(self.doc_ends[doc_id]),
+            }
+            for field, codes, dictionary in self.columns:
+                code = codes[doc_id]
+                if code >= 0:
+                    doc[field] = dictionary[code]
+            documents.append(doc)
+        return documents
+
+
+class SnapshotCollectionsParser(IntervalIndexCollectionsParser):
+    """Offline replacement of IntersectionCollectionsParser, answering get_for_region from a memory-mapped snapshot."""
+
+    def __init__(self, path: str, check_type_names: list[str], collection_names: Iterable[str] | None = None):
+        self.path = path
+        self.mmap = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self.mmap[: len(_MAGIC)]) != _MAGIC:
+            raise ValueError(f"{path} is not an ISV snapshot")
+        header_length = int.from_bytes(bytes(self.mmap[len(_MAGIC) : len(_MAGIC) + 8]), "little")
+        data_offset = len(_MAGIC) + 8 + header_length
+        header = json_util.loads(bytes(self.mmap[len(_MAGIC) + 8 : data_offset]).decode())
+        if header["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version {header['format_version']} of {path}")
+        self.created: str = header["created"]
+
+        def array(descriptor: dict[str, Any]) -> np.ndarray:
+            dtype = np.dtype(descriptor["dtype"])
+            start = data_offset + descriptor["offset"]
+            size = int(np.prod(descriptor["shape"])) * dtype.itemsize
+            return self.mmap[start : start + size].view(dtype).reshape(descriptor["shape"])
+
+        names = list(collection_names) if collection_names is not None else list(header["collections"])
+        super().__init__(
+            {name: SnapshotIndex(header["collections"][name], array) for name in names},
+            check_type_names,
+            source_fingerprint=header["source_fingerprint"],
+        )
@@ -0,0 +1,40 @@
+import bisect
+import operator
+from typing import Any, Iterable
+
+from isv.src.cnv_region import CNVRegion
+
+_get_start = operator.itemgetter("start")
+
+
+class SweepLine:
+    """Intersections of regions of one chromosome, visited in order of their start, with documents sorted by start.
+
+    The documents are read once, as far as the end of the current region. Only the active ones are kept: those read
+    that do not end before the start of the current region, since no later region starts before it.
+    """
+
+    def __init__(self, documents: Iterable[dict[str, Any]]):
+        self.documents = iter(documents)
+        self.active: list[dict[str, Any]] = []
+        self.scanned = 0
+        self.position = 0
+        self._next = self._read()
+
+    def _read(self) -> dict[str, Any] | None:
+        doc = next(self.documents, None)
+        if doc is not None:
+            self.scanned += 1
+        return doc
+
+    def intersections(self, region: CNVRegion) -> list[dict[str, Any]]:
+        """Documents with start <= region.end and end >= region.start, in order of their start."""
+        if region.start < self.position:
+            raise ValueError(f"Region {region.name} starts before the previously swept region")
+        self.position = region.start
+
+        while self._next is not None and self._next["start"] <= region.end:
+            self.active.append(self._next)
+            self._next = self._read()
+        self.active = [doc for doc in self.active if doc["end"] >= region.start]
+        return self.active[: bisect.bisect_right(self.active, region.end, key=_get_start)]